@@ -1,30 +1,118 @@
+import hmac
+import io
+import json
+import logging
+import mimetypes
 import os
-from datetime import datetime
+import re
+import threading
+import time
+import uuid
+import zipfile
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
 from functools import wraps
+from itertools import zip_longest
+from urllib.parse import quote
 
-import psycopg2
-import psycopg2.extras
+import click
 from dotenv import load_dotenv
 from flask import (
     Flask,
     abort,
+    before_render_template,
     flash,
     g,
+    has_request_context,
+    jsonify,
+    make_response,
     redirect,
     render_template,
     request,
+    send_from_directory,
     session,
+    stream_with_context,
+    template_rendered,
     url_for,
 )
-from vercel_blob import delete, put
+from markupsafe import Markup
+import psycopg2
+from psycopg2.extras import execute_values
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import is_resource_modified
 from werkzeug.utils import secure_filename
 
+import catalog_io
+import db
+import migrate
+import queries
+from assets import AssetPipeline
+from blobs import BlobIO, LocalBlobStore, VercelBlobStore
+from cache import GenerationCache, PageCache, bump_version
+from db import ConnectionPool, ReplicaSet, plain_cursor, server_cursor
+from images import ImagePipeline, srcset_urls
+from metrics import COUNT_BUCKETS, Registry
+from orders import OrderJournal
+from snapshot import StaticSnapshot
+
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.environ.get(
     "SECRET_KEY", "peacepet_luxury_cms_secret_key_change_me"
 )
+# 上传请求体上限：超出时根据 Content-Length 直接返回 413，不读取请求体
+app.config["MAX_CONTENT_LENGTH"] = (
+    int(os.environ.get("MAX_UPLOAD_MB", 64)) * 1024 * 1024
+)
+# 批量导入带图片压缩包，单独放宽上限
+app.config["IMPORT_MAX_CONTENT_LENGTH"] = (
+    int(os.environ.get("IMPORT_MAX_UPLOAD_MB", 1024)) * 1024 * 1024
+)
+
+# --- 静态资源 ---
+# 启动时把 static/ 下的文件压缩、按内容哈希命名并预压缩到 static/dist/，
+# url_for('static', ...) 输出哈希文件名，浏览器可永久缓存
+asset_pipeline = AssetPipeline(app.static_folder)
+asset_pipeline.load()
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+
+@app.url_defaults
+def hashed_static_url(endpoint, values):
+    if endpoint == "static":
+        hashed = asset_pipeline.hashed(values.get("filename"))
+        if hashed:
+            values["filename"] = hashed
+
+
+def send_static(filename):
+    if not asset_pipeline.is_hashed(filename):
+        return app.send_static_file(filename)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if request.accept_encodings[encoding] and os.path.isfile(
+            os.path.join(app.static_folder, filename + suffix)
+        ):
+            response = send_from_directory(
+                app.static_folder,
+                filename + suffix,
+                mimetype=mimetype,
+                max_age=ASSET_MAX_AGE,
+            )
+            response.headers["Content-Encoding"] = encoding
+            break
+    else:
+        response = send_from_directory(
+            app.static_folder, filename, max_age=ASSET_MAX_AGE
+        )
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+app.view_functions["static"] = send_static
 
 # 1. 扩充字体选项 (Issue 2)
 FONT_OPTIONS = [
@@ -46,22 +134,208 @@ FONT_OPTIONS = [
 ]
 
 
+# --- 性能监控 ---
+metrics = Registry()
+request_latency = metrics.histogram(
+    "http_request_duration_seconds",
+    "Time to handle a request.",
+    ("endpoint", "method", "status"),
+)
+request_queries = metrics.histogram(
+    "http_request_db_queries",
+    "Database statements per request.",
+    ("endpoint",),
+    buckets=COUNT_BUCKETS,
+)
+db_query_latency = metrics.histogram(
+    "db_query_duration_seconds", "Time per database statement."
+)
+slow_queries = metrics.counter(
+    "db_slow_queries_total", "Database statements slower than SLOW_QUERY_MS."
+)
+blob_latency = metrics.histogram(
+    "blob_io_duration_seconds",
+    "Blob storage time; a put is the wall time of one concurrent batch.",
+    ("op",),
+)
+template_latency = metrics.histogram(
+    "template_render_duration_seconds", "Template render time.", ("template",)
+)
+
+SLOW_QUERY_SECONDS = float(os.environ.get("SLOW_QUERY_MS", 200)) / 1000
+# SERVER_TIMING=1 时响应带 Server-Timing 头，浏览器开发者工具里可直接看到耗时拆分
+SERVER_TIMING = os.environ.get("SERVER_TIMING") == "1"
+slow_query_log = logging.getLogger("peacepet.slow_query")
+
+
+def record_query(sql, seconds):
+    db_query_latency.observe(seconds)
+    if seconds >= SLOW_QUERY_SECONDS:
+        slow_queries.inc()
+        if isinstance(sql, bytes):
+            sql = sql.decode("utf-8", "replace")
+        slow_query_log.warning("%.1f ms: %s", seconds * 1000, sql[:2000])
+    if has_request_context() and "timings" in g:
+        g.timings["db"] += seconds
+        g.db_queries += 1
+
+
+def record_blob_io(op, seconds):
+    blob_latency.observe(seconds, op)
+    if has_request_context() and "timings" in g:
+        g.timings["blob"] += seconds
+
+
+db.on_query = record_query
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.timings = {"db": 0.0, "blob": 0.0, "tpl": 0.0}
+    g.db_queries = 0
+
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.render_start = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def record_render(sender, template, context, **extra):
+    seconds = time.perf_counter() - g.pop("render_start")
+    template_latency.observe(seconds, template.name)
+    if "timings" in g:
+        g.timings["tpl"] += seconds
+
+
+@app.after_request
+def record_request(response):
+    if "request_start" not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.endpoint or "unmatched"
+    request_latency.observe(elapsed, endpoint, request.method, response.status_code)
+    request_queries.observe(g.db_queries, endpoint)
+    if SERVER_TIMING:
+        timings = [
+            f'db;dur={g.timings["db"] * 1000:.1f};desc="{g.db_queries} queries"',
+            f'blob;dur={g.timings["blob"] * 1000:.1f}',
+            f'tpl;dur={g.timings["tpl"] * 1000:.1f}',
+            f"total;dur={elapsed * 1000:.1f}",
+        ]
+        response.headers["Server-Timing"] = ", ".join(timings)
+    return response
+
+
 # --- Database and Auth ---
 
 
+def admin_session():
+    # 匿名访客没有会话 cookie，这时不访问 session，响应就不会带 Vary: Cookie
+    if app.config["SESSION_COOKIE_NAME"] not in request.cookies:
+        return False
+    return session.get("is_admin", False)
+
+
 @app.context_processor
 def inject_common():
     return {
         "FONT_OPTIONS": FONT_OPTIONS,
         "now": datetime.now,
-        "is_admin": session.get("is_admin", False),
+        "is_admin": admin_session(),
     }
 
 
+db_pool = ConnectionPool(
+    os.environ.get("POSTGRES_URL_NON_POOLING"),
+    minconn=int(os.environ.get("DB_POOL_MIN", 1)),
+    maxconn=int(os.environ.get("DB_POOL_MAX", 10)),
+    timeout=float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+)
+# 只读副本（逗号分隔的 DSN）；不可用时回退到主库
+replicas = ReplicaSet(
+    [dsn for dsn in os.environ.get("POSTGRES_REPLICA_URLS", "").split(",") if dsn],
+    retry_after=float(os.environ.get("DB_REPLICA_RETRY_AFTER", 30)),
+    minconn=int(os.environ.get("DB_POOL_MIN", 1)),
+    maxconn=int(os.environ.get("DB_POOL_MAX", 10)),
+    timeout=float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+)
+
+# 设置 BLOB_LOCAL_DIR 时图片存到本地目录（开发/测试用），否则使用 Vercel Blob
+if os.environ.get("BLOB_LOCAL_DIR"):
+    blob_store = LocalBlobStore(
+        os.environ["BLOB_LOCAL_DIR"],
+        os.environ.get("BLOB_LOCAL_URL", "/static"),
+    )
+else:
+    blob_store = VercelBlobStore()
+blob_io = BlobIO(
+    blob_store,
+    max_workers=int(os.environ.get("BLOB_MAX_CONCURRENCY", 4)),
+    on_io=record_blob_io,
+)
+image_pipeline = ImagePipeline(
+    blob_store,
+    widths=[int(w) for w in os.environ.get("IMAGE_WIDTHS", "320,640,1280").split(",")],
+)
+
+
+# 只读的前台页面可以走副本；后台会话始终读主库，能立刻看到自己的修改
+REPLICA_ENDPOINTS = {
+    "index",
+    "about",
+    "catalog_index",
+    "deals",
+    "new_arrivals",
+    "category_detail",
+    "search",
+    "search_suggest",
+    "product_detail",
+}
+
+
+def reads_from_replica():
+    return (
+        bool(replicas)
+        and has_request_context()
+        and not g.get("primary_only")
+        and request.endpoint in REPLICA_ENDPOINTS
+        and request.method in ("GET", "HEAD")
+        and not admin_session()
+    )
+
+
 def get_db_conn():
-    conn = psycopg2.connect(os.environ.get("POSTGRES_URL_NON_POOLING"))
-    conn.cursor_factory = psycopg2.extras.DictCursor
-    return conn
+    # 每个请求只借用一个连接，在 teardown 时归还连接池
+    if "db_conn" not in g:
+        borrowed = replicas.getconn() if reads_from_replica() else None
+        g.db_pool, g.db_conn = borrowed or (db_pool, db_pool.getconn())
+    return g.db_conn
+
+
+@app.errorhandler(psycopg2.OperationalError)
+def retry_on_primary(e):
+    # 副本的连接在请求中途断开，或查询因回放冲突被取消：丢弃这个连接，
+    # 在主库上重做一次。只有只读请求会用副本，重做是安全的
+    pool = g.get("db_pool")
+    if pool is None or pool is db_pool:
+        raise e
+    conn = g.pop("db_conn")
+    g.pop("db_pool")
+    if conn.closed:
+        replicas.mark_down(pool)
+    pool.putconn(conn, discard=True)
+    g.primary_only = True
+    set_language_and_nav()
+    return app.dispatch_request()
+
+
+@app.teardown_appcontext
+def release_db_conn(exc):
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        g.pop("db_pool").putconn(conn)
 
 
 def admin_required(f):
@@ -78,18 +352,235 @@ def admin_required(f):
 # --- App Lifecycle ---
 
 
+NAV_GENERATION_KEY = "__nav_generation__"
+CATALOG_GENERATION_KEY = "__catalog_generation__"
+
+
+def load_nav(c):
+    c.execute("SELECT * FROM categories ORDER BY sort_order DESC, id DESC")
+    categories = c.fetchall()
+    c.execute(
+        "SELECT * FROM settings WHERE key NOT IN (%s, %s)",
+        (NAV_GENERATION_KEY, CATALOG_GENERATION_KEY),
+    )
+    settings = {row["key"]: row["value"] for row in c.fetchall()}
+    return categories, settings
+
+
+# 导航分类和站点设置只在后台保存时变化，缓存在进程内，按代数计数器失效
+nav_cache = GenerationCache(
+    NAV_GENERATION_KEY,
+    load_nav,
+    check_interval=float(os.environ.get("NAV_CACHE_CHECK_INTERVAL", 5)),
+)
+# 读副本的请求单独一份：副本可能还没回放后台的修改，它读到的旧版本不能覆盖
+# 后台（读主库）已经看到的新数据
+replica_nav_cache = GenerationCache(
+    NAV_GENERATION_KEY,
+    load_nav,
+    check_interval=float(os.environ.get("NAV_CACHE_CHECK_INTERVAL", 5)),
+)
+
+
+def save_settings(c, updates):
+    """Upsert ``updates`` in one statement; returns whether any value changed.
+
+    The database compares each value with the stored one, so keys whose
+    value is unchanged are not rewritten and do not count as a change.
+    """
+    if not updates:
+        return False
+    execute_values(
+        c,
+        "INSERT INTO settings (key, value) VALUES %s"
+        " ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value"
+        " WHERE settings.value IS DISTINCT FROM EXCLUDED.value",
+        list(updates.items()),
+        # rowcount 只统计最后一页，所以一页写完
+        page_size=len(updates),
+    )
+    return c.rowcount > 0
+
+
+def commit_nav_change(conn):
+    bump_version(conn.cursor(), NAV_GENERATION_KEY)
+    conn.commit()
+    nav_cache.invalidate()
+    replica_nav_cache.invalidate()
+    if static_snapshot is not None:
+        static_snapshot.submit()
+
+
+# 前台页面整页缓存；导航代数包含在 key 中，分类/设置变化后旧页面自然失效
+page_cache = PageCache(
+    CATALOG_GENERATION_KEY,
+    maxsize=int(os.environ.get("PAGE_CACHE_SIZE", 512)),
+    ttl=float(os.environ.get("PAGE_CACHE_TTL", 300)),
+    check_interval=float(os.environ.get("NAV_CACHE_CHECK_INTERVAL", 5)),
+)
+
+
+# 商品卡片和详情块按 (片段, 语言, 商品) 渲染一次后缓存，列表页由片段拼成；
+# 与整页缓存共用代数计数器和 product:<id> 标签
+fragment_cache = PageCache(
+    CATALOG_GENERATION_KEY,
+    maxsize=int(os.environ.get("FRAGMENT_CACHE_SIZE", 4096)),
+    ttl=float(os.environ.get("PAGE_CACHE_TTL", 300)),
+    check_interval=float(os.environ.get("NAV_CACHE_CHECK_INTERVAL", 5)),
+)
+
+
+PAGE_MAX_AGE = int(os.environ.get("PAGE_MAX_AGE", 60))
+
+
+def commit_catalog_change(conn, *tags):
+    version = bump_version(conn.cursor(), CATALOG_GENERATION_KEY)
+    conn.commit()
+    page_cache.invalidate(version, *tags)
+    fragment_cache.invalidate(version, *tags)
+    if static_snapshot is not None:
+        static_snapshot.submit(tags)
+
+
+def cached_fragment(key, product_id, build):
+    """``build()``'s result for ``key``, cached until product_id is written."""
+    fragment_cache.sync(get_db_conn)
+    value = fragment_cache.get(key)
+    if value is None:
+        version = fragment_cache.version
+        value = build()
+        if value is not None:
+            fragment_cache.set(key, value, (f"product:{product_id}",), version)
+    return value
+
+
+def render_fragment(template, **context):
+    # 片段在页面模板渲染过程中生成，直接用 jinja 环境渲染，不触发 Flask 的渲染信号
+    return Markup(app.jinja_env.get_template(template).render(**context))
+
+
+def add_validators(response, etag, last_modified):
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = PAGE_MAX_AGE
+    return response
+
+
+def cached_page(*tags):
+    """Serve a public view from page_cache; tags may use the view's kwargs.
+
+    Responses carry an ETag/Last-Modified built from the nav and catalog
+    versions, so revalidations get a 304 before the view runs any query.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if admin_session():
+                return f(*args, **kwargs)
+            page_cache.sync(get_db_conn)
+            catalog_version = page_cache.version
+            etag = f"{g.nav_version[0]}-{catalog_version[0]}-{g.lang}"
+            modified_at = max(g.nav_version[1], catalog_version[1])
+            last_modified = (
+                datetime.fromtimestamp(modified_at, timezone.utc)
+                if modified_at
+                else None
+            )
+            if not is_resource_modified(
+                request.environ, etag=etag, last_modified=last_modified
+            ):
+                return add_validators(
+                    app.response_class(status=304), etag, last_modified
+                )
+
+            key = (g.nav_version, g.lang, request.full_path)
+            hit = page_cache.get(key)
+            if hit is not None:
+                body, mimetype = hit
+                response = app.response_class(body, mimetype=mimetype)
+                return add_validators(response, etag, last_modified)
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                # 渲染期间后台改了数据时 set 不会存入：页面可能是按旧数据渲染的
+                page_cache.set(
+                    key,
+                    (response.get_data(), response.mimetype),
+                    tuple(tag.format(**kwargs) for tag in tags),
+                    catalog_version,
+                )
+                add_validators(response, etag, last_modified)
+            return response
+
+        return decorated_function
+
+    return decorator
+
+
+LANGUAGES = ("en", "zh")
+# 前台页面的语言在 URL 里（/en/...、/zh/...），同一 URL 的匿名响应完全相同
+LANG_PREFIX = "/<any(en, zh):lang>"
+
+
+@app.url_value_preprocessor
+def pull_lang(endpoint, values):
+    if values and "lang" in values:
+        g.lang = values.pop("lang")
+
+
+@app.url_defaults
+def add_lang(endpoint, values):
+    if "lang" not in values and app.url_map.is_endpoint_expecting(endpoint, "lang"):
+        values["lang"] = g.get("lang", LANGUAGES[0])
+
+
+def preferred_lang():
+    return request.accept_languages.best_match(LANGUAGES, default=LANGUAGES[0])
+
+
+# url_for 自己的参数名；查询串里出现这些键时不能原样传给 url_for
+URL_FOR_RESERVED = {"lang", "endpoint", "_external", "_anchor", "_method", "_scheme"}
+
+
+@app.template_global()
+def switch_lang_url():
+    """The current page in the other language."""
+    lang = "en" if g.lang == "zh" else "zh"
+    if app.url_map.is_endpoint_expecting(request.endpoint, "lang"):
+        args = {
+            key: values
+            for key, values in request.args.to_dict(flat=False).items()
+            if key not in URL_FOR_RESERVED and key not in request.view_args
+        }
+        return url_for(request.endpoint, **request.view_args, **args, lang=lang)
+    return url_for("index", lang=lang)
+
+
+# 不渲染页面的端点不需要导航数据
+NO_NAV_ENDPOINTS = {
+    "static",
+    "healthz",
+    "readyz",
+    "language_root",
+    "switch_lang",
+    "legacy_redirect",
+    "db_stats",
+    "metrics_endpoint",
+}
+
+
 @app.before_request
 def set_language_and_nav():
-    if "lang" not in session:
-        session["lang"] = "en"
-    g.lang = session["lang"]
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM categories ORDER BY sort_order DESC, id DESC")
-    g.categories = c.fetchall()
-    c.execute("SELECT * FROM settings")
-    g.settings = {row["key"]: row["value"] for row in c.fetchall()}
-    conn.close()
+    if request.endpoint in NO_NAV_ENDPOINTS:
+        return
+    if "lang" not in g:
+        # 后台、登录等不带语言前缀的页面按浏览器语言显示
+        g.lang = preferred_lang()
+    # 缓存对象在线程间共享，只读使用
+    cache = replica_nav_cache if reads_from_replica() else nav_cache
+    g.nav_version, (g.categories, g.settings) = cache.get(get_db_conn)
 
 
 # --- Auth Routes ---
@@ -124,42 +615,198 @@ def logout():
 # --- Language and Public Routes ---
 
 
+@app.route("/")
+def language_root():
+    response = redirect(url_for("index", lang=preferred_lang()))
+    response.vary.add("Accept-Language")
+    return response
+
+
 @app.route("/switch_lang/<new_lang>")
 def switch_lang(new_lang):
-    if new_lang in ["en", "zh"]:
-        session["lang"] = new_lang
-    return redirect(request.referrer or url_for("index"))
+    # 旧的切换链接：语言已改为放在 URL 里
+    return redirect(
+        url_for("index", lang=new_lang if new_lang in LANGUAGES else preferred_lang())
+    )
+
+
+@app.route("/<path:path>")
+def legacy_redirect(path):
+    """Send pre-language URLs such as /product/5 to /<lang>/product/5."""
+    target = f"/{preferred_lang()}/{path}"
+    try:
+        endpoint, _ = app.url_map.bind_to_environ(request.environ).match(target)
+    except HTTPException:
+        abort(404)
+    if not app.url_map.is_endpoint_expecting(endpoint, "lang"):
+        abort(404)
+    if request.query_string:
+        target += "?" + request.query_string.decode("latin-1")
+    # 目标语言取决于 Accept-Language，不能做永久重定向，共享缓存也要按它区分
+    response = redirect(target)
+    response.vary.add("Accept-Language")
+    return response
 
 
 # --- 前台路由 ---
-@app.route("/")
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", 24))
+MAX_PAGE_SIZE = 100
+
+# 列表页只取卡片用到的列（当前语言），用轻量 namedtuple 代替 DictRow
+ProductCard = namedtuple("ProductCard", "id title price main_image main_image_srcset")
+
+
+def fetch_product_cards(where, params=(), limit=None):
+    c = plain_cursor(get_db_conn())
+    if limit is not None:
+        params += (limit,)
+    c.execute(queries.product_cards(g.lang, where, limit is not None), params)
+    return list(map(ProductCard._make, c.fetchall()))
+
+
+# 首屏内的前几张卡片不延迟加载图片，第一张（页面最大的图片）还提高下载优先级
+EAGER_CARDS = int(os.environ.get("EAGER_CARDS", 4))
+
+
+@app.template_global()
+def product_card(product, emphasis=False, position=None):
+    """A listing card for ``product`` (a ProductCard), from fragment_cache.
+
+    ``position`` is the card's index on the page; the first ``EAGER_CARDS``
+    load their image eagerly and the first one with ``fetchpriority=high``.
+    """
+    if position is None or position >= EAGER_CARDS:
+        loading = "lazy"
+    else:
+        loading = "high" if position == 0 else "eager"
+    return cached_fragment(
+        ("card", g.lang, emphasis, loading, product.id),
+        product.id,
+        lambda: render_fragment(
+            "product_card.html", product=product, emphasis=emphasis, loading=loading
+        ),
+    )
+
+
+def fetch_product_page(where, params=()):
+    """Keyset page of product cards matching ``where``, newest first.
+
+    Reads ``after`` (the last id of the previous page) and ``per_page`` from
+    the query string, so every page costs one bounded index scan however
+    deep the visitor browses. Returns ``(products, next_after)``.
+    """
+    per_page = request.args.get("per_page", PAGE_SIZE, type=int)
+    per_page = min(max(per_page, 1), MAX_PAGE_SIZE)
+    after = request.args.get("after", type=int)
+    if after is not None:
+        where += " AND id < %s"
+        params += (after,)
+    products = fetch_product_cards(where, params, limit=per_page + 1)
+    next_after = products[per_page - 1].id if len(products) > per_page else None
+    return products[:per_page], next_after
+
+
+def render_listing(template, products, next_after, **context):
+    next_url = None
+    if next_after is not None:
+        args = {k: request.args[k] for k in ("per_page", "format") if k in request.args}
+        next_url = url_for(
+            request.endpoint, **request.view_args, **args, after=next_after
+        )
+    # 无限滚动：?format=json 返回同一页的卡片数据
+    if request.args.get("format") == "json":
+        return jsonify(
+            products=[
+                dict(p._asdict(), url=url_for("product_detail", product_id=p.id))
+                for p in products
+            ],
+            next_after=next_after,
+            next_url=next_url,
+        )
+    return render_template(template, products=products, next_url=next_url, **context)
+
+
+CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+")
+SUGGEST_SIZE = 8
+
+
+def search_terms(q):
+    """``(english, chinese)`` tsquery text for a search box query, or None.
+
+    Every English word is matched as a prefix so partial input already
+    finds products; a Chinese run matches by its character bigrams, the
+    same grams migration 0006 indexes.
+    """
+    words = re.findall(r"[^\W_]+", CJK_RUN.sub(" ", q))
+    grams = []
+    for run in CJK_RUN.findall(q):
+        grams.extend(
+            [run] if len(run) == 1 else (run[i : i + 2] for i in range(len(run) - 1))
+        )
+    return (
+        " & ".join(f"{word}:*" for word in words) or None,
+        " & ".join(grams) or None,
+    )
+
+
+def search_product_cards(q, limit, offset=0):
+    english, chinese = search_terms(q)
+    if english is None and chinese is None:
+        return []
+    c = plain_cursor(get_db_conn())
+    c.execute(queries.product_search(g.lang), (english, chinese, limit, offset))
+    return list(map(ProductCard._make, c.fetchall()))
+
+
+REVIEWS_PAGE_SIZE = int(os.environ.get("REVIEWS_PAGE_SIZE", 6))
+Review = namedtuple("Review", "id rating text image image_srcset")
+
+
+def fetch_review_page(product_id):
+    """Keyset page of a product's reviews, newest first, from ``?after=``."""
+    where, params = "product_id = %s", (product_id,)
+    after = request.args.get("after", type=int)
+    if after is not None:
+        where += " AND id < %s"
+        params += (after,)
+    c = plain_cursor(get_db_conn())
+    c.execute(queries.review_page(g.lang, where), params + (REVIEWS_PAGE_SIZE + 1,))
+    reviews = list(map(Review._make, c.fetchall()))
+    next_after = (
+        reviews[REVIEWS_PAGE_SIZE - 1].id if len(reviews) > REVIEWS_PAGE_SIZE else None
+    )
+    return reviews[:REVIEWS_PAGE_SIZE], next_after
+
+
+@app.route(f"{LANG_PREFIX}/")
+@cached_page("products")
 def index():
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM products WHERE is_featured = 1 ORDER BY id DESC LIMIT 6")
-    products = c.fetchall()
-    conn.close()
+    products = fetch_product_cards("is_featured = 1", limit=6)
     return render_template("index.html", products=products)
 
 
-@app.route("/about")
+@app.route(f"{LANG_PREFIX}/about")
+@cached_page()
 def about():
     about_images_data = [
         {
             "key": "about_image_1",
             "src": g.settings.get("about_image_1"),
+            "srcset": g.settings.get("about_image_1_srcset"),
             "caption_en": g.settings.get("about_caption_1_en"),
             "caption_zh": g.settings.get("about_caption_1_zh"),
         },
         {
             "key": "about_image_2",
             "src": g.settings.get("about_image_2"),
+            "srcset": g.settings.get("about_image_2_srcset"),
             "caption_en": g.settings.get("about_caption_2_en"),
             "caption_zh": g.settings.get("about_caption_2_zh"),
         },
         {
             "key": "about_image_3",
             "src": g.settings.get("about_image_3"),
+            "srcset": g.settings.get("about_image_3_srcset"),
             "caption_en": g.settings.get("about_caption_3_en"),
             "caption_zh": g.settings.get("about_caption_3_zh"),
         },
@@ -167,95 +814,443 @@ def about():
     return render_template("about.html", about_images_data=about_images_data)
 
 
-@app.route("/catalog")
+@app.route(f"{LANG_PREFIX}/catalog")
+@cached_page()
 def catalog_index():
     return render_template("catalog_index.html")
 
 
-@app.route("/deals")
+@app.route(f"{LANG_PREFIX}/deals")
+@cached_page("products")
 def deals():
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM products WHERE is_deal = 1 ORDER BY id DESC")
-    products = c.fetchall()
-    conn.close()
-    return render_template("deals.html", products=products)
+    products, next_after = fetch_product_page("is_deal = 1")
+    return render_listing("deals.html", products, next_after)
 
 
-@app.route("/new_arrivals")
+@app.route(f"{LANG_PREFIX}/new_arrivals")
+@cached_page("products")
 def new_arrivals():
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM products WHERE is_new = 1 ORDER BY id DESC")
-    products = c.fetchall()
-    conn.close()
-    return render_template("new_arrivals.html", products=products)
+    products, next_after = fetch_product_page("is_new = 1")
+    return render_listing("new_arrivals.html", products, next_after)
 
 
-@app.route("/catalog/<slug>")
+@app.route(f"{LANG_PREFIX}/catalog/<slug>")
+@cached_page("products")
 def category_detail(slug):
     conn = get_db_conn()
     c = conn.cursor()
-    c.execute("SELECT * FROM categories WHERE slug = %s", (slug,))
+    c.execute(queries.CATEGORY_BY_SLUG, (slug,))
     category = c.fetchone()
     if not category:
         abort(404)
-    c.execute(
-        "SELECT * FROM products WHERE category_id = %s ORDER BY id DESC",
-        (category["id"],),
+    products, next_after = fetch_product_page("category_id = %s", (category["id"],))
+    return render_listing(
+        "category_detail.html", products, next_after, category=category
     )
-    products = c.fetchall()
-    conn.close()
-    return render_template("category_detail.html", products=products, category=category)
 
 
-@app.route("/product/<int:product_id>")
-def product_detail(product_id):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM products WHERE id = %s", (product_id,))
+@app.route(f"{LANG_PREFIX}/search")
+@cached_page("products")
+def search():
+    q = request.args.get("q", "").strip()[:100]
+    per_page = request.args.get("per_page", PAGE_SIZE, type=int)
+    per_page = min(max(per_page, 1), MAX_PAGE_SIZE)
+    page = max(request.args.get("page", 1, type=int), 1)
+    products = search_product_cards(q, per_page + 1, (page - 1) * per_page)
+    next_url = None
+    if len(products) > per_page:
+        args = {k: request.args[k] for k in ("per_page", "format") if k in request.args}
+        next_url = url_for("search", q=q, **args, page=page + 1)
+    products = products[:per_page]
+    if request.args.get("format") == "json":
+        return jsonify(
+            products=[
+                dict(p._asdict(), url=url_for("product_detail", product_id=p.id))
+                for p in products
+            ],
+            next_url=next_url,
+        )
+    return render_template("search.html", q=q, products=products, next_url=next_url)
+
+
+@app.route(f"{LANG_PREFIX}/search/suggest")
+@cached_page("products")
+def search_suggest():
+    q = request.args.get("q", "").strip()[:100]
+    return jsonify(
+        suggestions=[
+            {"title": p.title, "url": url_for("product_detail", product_id=p.id)}
+            for p in search_product_cards(q, SUGGEST_SIZE)
+        ]
+    )
+
+
+ProductSummary = namedtuple("ProductSummary", "title_en review_count star_counts body")
+
+
+def load_product_summary(product_id):
+    """The rendered detail block of a product and the totals around it."""
+    c = get_db_conn().cursor()
+    c.execute(queries.product_detail(g.lang), (product_id,))
     product = c.fetchone()
     if not product:
-        abort(404)
-    c.execute(
-        "SELECT * FROM feedback WHERE product_id = %s ORDER BY id DESC", (product_id,)
+        return None
+    review_count = product["review_count"]
+    rating = (
+        product["review_rating_sum"] / review_count
+        if review_count
+        else product["avg_rating"]
     )
-    reviews = c.fetchall()
-    conn.close()
-    bullets_field = f"bullet_points_{g.lang}"
-    bullets = product[bullets_field].split("\n") if product[bullets_field] else []
-    a_plus_imgs = (
-        product["a_plus_images"].split(",") if product["a_plus_images"] else []
+    a_plus_imgs = product["a_plus_image_list"]
+    body = render_fragment(
+        "product_body.html",
+        product=product,
+        rating=rating,
+        review_count=review_count,
+        bullets=product[f"bullets_{g.lang}"],
+        a_plus_imgs=list(
+            zip_longest(a_plus_imgs, product["a_plus_srcset_list"][: len(a_plus_imgs)])
+        ),
     )
+    star_counts = [(n, product[f"review_stars_{n}"]) for n in range(5, 0, -1)]
+    return ProductSummary(product["title_en"], review_count, star_counts, body)
+
+
+@app.route(f"{LANG_PREFIX}/product/<int:product_id>")
+@cached_page("product:{product_id}")
+def product_detail(product_id):
+    reviews, next_after = fetch_review_page(product_id)
+    next_url = None
+    if next_after is not None:
+        next_url = url_for(
+            "product_detail", product_id=product_id, after=next_after, format="json"
+        )
+    # 评价懒加载：?format=json&after=... 只返回下一页评价
+    if request.args.get("format") == "json":
+        return jsonify(
+            reviews=[review._asdict() for review in reviews],
+            next_after=next_after,
+            next_url=next_url,
+        )
+
+    summary = cached_fragment(
+        ("detail", g.lang, product_id),
+        product_id,
+        lambda: load_product_summary(product_id),
+    )
+    if summary is None:
+        abort(404)
     return render_template(
         "product.html",
-        product=product,
-        bullets=bullets,
-        a_plus_imgs=a_plus_imgs,
+        detail=summary.body,
+        product_title=summary.title_en,
         reviews=reviews,
+        reviews_next_url=next_url,
+        review_count=summary.review_count,
+        star_counts=summary.star_counts,
     )
 
 
+def write_orders(orders):
+    conn = db_pool.getconn()
+    try:
+        execute_values(
+            conn.cursor(),
+            "INSERT INTO orders (intake_id, product_name, customer_name, contact_info, note, date) VALUES %s ON CONFLICT (intake_id) DO NOTHING",
+            [
+                (
+                    o["intake_id"],
+                    o["product_name"],
+                    o["customer_name"],
+                    o["contact_info"],
+                    o["note"],
+                    o["date"],
+                )
+                for o in orders
+            ],
+        )
+        conn.commit()
+    finally:
+        db_pool.putconn(conn)
+
+
+order_journal = OrderJournal(
+    os.environ.get("ORDER_JOURNAL_DIR", "order_journal"),
+    write_orders,
+    flush_interval=float(os.environ.get("ORDER_FLUSH_INTERVAL", 1)),
+)
+
+
 @app.route("/submit_order", methods=["POST"])
 def submit_order():
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO orders (product_name, customer_name, contact_info, note, date) VALUES (%s, %s, %s, %s, %s)",
-        (
-            request.form.get("product_name"),
-            request.form.get("customer_name"),
-            request.form.get("contact"),
-            request.form.get("note", ""),
-            datetime.now().strftime("%Y-%m-%d %H:%M"),
-        ),
+    customer_name = request.form.get("customer_name", "").strip()
+    contact = request.form.get("contact", "").strip()
+    if not customer_name or not contact:
+        return "Missing name or contact", 400
+    # 订单先写入本地日志 (fsync 后即返回)，由后台批量写入数据库
+    order_journal.append(
+        {
+            "intake_id": uuid.uuid4().hex,
+            "product_name": request.form.get("product_name"),
+            "customer_name": customer_name,
+            "contact_info": contact,
+            "note": request.form.get("note", ""),
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M"),
+        }
     )
-    conn.commit()
-    conn.close()
     return "OK"
 
 
+# 预热完成前 /readyz 返回 503，负载均衡器不会把流量转过来；/healthz 只表示进程还活着
+ready = threading.Event()
+
+
+@app.route("/healthz")
+def healthz():
+    return "OK"
+
+
+@app.route("/readyz")
+def readyz():
+    if not ready.is_set():
+        return "warming up", 503
+    return "OK"
+
+
+def db_stats():
+    return jsonify(dict(db_pool.stats(), replicas=replicas.stats()))
+
+
+def metrics_endpoint():
+    gauges = [
+        (f"db_pool_{key}", f"Connection pool {key.replace('_', ' ')}.", value)
+        for key, value in db_pool.stats().items()
+    ]
+    for n, stats in enumerate(replicas.stats()):
+        gauges += [
+            (
+                f"db_replica_{n}_{key}",
+                f"Replica {n} pool {key.replace('_', ' ')}.",
+                value,
+            )
+            for key, value in stats.items()
+        ]
+    if replicas:
+        gauges.append(
+            (
+                "db_replica_failovers",
+                "Reads sent to the primary with no replica up.",
+                replicas.failovers,
+            )
+        )
+    gauges += [
+        (f"page_cache_{key}", f"Page cache {key}.", value)
+        for key, value in page_cache.stats().items()
+    ]
+    gauges += [
+        (f"fragment_cache_{key}", f"Fragment cache {key}.", value)
+        for key, value in fragment_cache.stats().items()
+    ]
+    gauges += [
+        ("nav_cache_hits", "Nav cache hits.", nav_cache.hits),
+        ("nav_cache_reloads", "Nav cache reloads.", nav_cache.reloads),
+    ]
+    if replicas:
+        gauges += [
+            (
+                "replica_nav_cache_hits",
+                "Replica nav cache hits.",
+                replica_nav_cache.hits,
+            ),
+            (
+                "replica_nav_cache_reloads",
+                "Replica nav cache reloads.",
+                replica_nav_cache.reloads,
+            ),
+        ]
+    return app.response_class(
+        metrics.render(gauges), mimetype="text/plain; version=0.0.4"
+    )
+
+
+# 多进程时经公共端口抓取会随机落到某个 worker，计数器在不相关的进程间来回跳；
+# run.py 这时关掉公共端点，让每个 worker 在自己的内部端口上提供 internal_app
+app.config["PUBLIC_METRICS"] = True
+# 公共端口上的监控端点只对管理员会话或带 Authorization: Bearer <METRICS_TOKEN> 的请求开放
+app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN", "")
+internal_app = Flask(__name__, static_folder=None)
+
+
+def public_monitoring(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not app.config["PUBLIC_METRICS"]:
+            abort(404)
+        token = app.config["METRICS_TOKEN"]
+        authorization = request.headers.get("Authorization", "")
+        if not admin_session() and not (
+            token
+            and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
+        ):
+            abort(401)
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
+for rule, view in (("/stats/db", db_stats), ("/metrics", metrics_endpoint)):
+    app.add_url_rule(rule, view_func=public_monitoring(view))
+    internal_app.add_url_rule(rule, view_func=view)
+
+
 # --- 后台管理路由 ---
+ADMIN_PAGE_SIZE = 50
+
+
+def admin_page(select, where, params, sort_columns, id_column="id"):
+    """One keyset page of an admin table as JSON.
+
+    ``?sort=`` names a key of ``sort_columns``, prefixed with ``-`` for
+    descending (the default is ``-id``); ``?after=`` and ``?after_key=``
+    carry the id and sort value of the previous page's last row, so every
+    page is a bounded index scan however large the table grows.
+    """
+    sort = request.args.get("sort", "-id")
+    column = sort_columns.get(sort.lstrip("-"))
+    if column is None:
+        abort(400)
+    order = "DESC" if sort.startswith("-") else "ASC"
+    per_page = request.args.get("per_page", ADMIN_PAGE_SIZE, type=int)
+    per_page = min(max(per_page, 1), MAX_PAGE_SIZE)
+    after = request.args.get("after", type=int)
+    if after is not None:
+        where = where + [
+            f"({column}, {id_column}) {'<' if order == 'DESC' else '>'} (%s, %s)"
+        ]
+        params += (request.args.get("after_key"), after)
+    c = get_db_conn().cursor()
+    c.execute(
+        queries.keyset_page(select, where, column, order, id_column),
+        params + (per_page + 1,),
+    )
+    rows = [dict(row) for row in c.fetchall()]
+    next_url = None
+    if len(rows) > per_page:
+        last = rows[per_page - 1]
+        sort_key = sort.lstrip("-")
+        args = request.args.to_dict()
+        args.update(after=last["id"], after_key=last[sort_key])
+        next_url = url_for(request.endpoint, **args)
+    return jsonify(rows=rows[:per_page], next_url=next_url)
+
+
+def parse_date(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        abort(400)
+
+
+@app.route("/admin/api/orders")
+@admin_required
+def admin_orders():
+    where, params = [], ()
+    date_from, date_to = parse_date("from"), parse_date("to")
+    # date 列是 "YYYY-MM-DD HH:MM" 文本，按字符串比较即按时间比较
+    if date_from:
+        where.append("date >= %s")
+        params += (date_from.strftime("%Y-%m-%d"),)
+    if date_to:
+        where.append("date < %s")
+        params += ((date_to + timedelta(days=1)).strftime("%Y-%m-%d"),)
+    return admin_page(queries.ADMIN_ORDERS, where, params, queries.ADMIN_ORDER_SORTS)
+
+
+@app.route("/admin/api/products")
+@admin_required
+def admin_products():
+    where, params = [], ()
+    category_id = request.args.get("category_id", type=int)
+    if category_id is not None:
+        where.append("p.category_id = %s")
+        params += (category_id,)
+    english, chinese = search_terms(request.args.get("q", "").strip()[:100])
+    if english or chinese:
+        where.append(
+            "(p.search_en @@ to_tsquery('english', %s) OR p.search_zh @@ to_tsquery('simple', %s))"
+        )
+        params += (english, chinese)
+    return admin_page(
+        queries.ADMIN_PRODUCTS,
+        where,
+        params,
+        queries.ADMIN_PRODUCT_SORTS,
+        id_column="p.id",
+    )
+
+
+def upload_path(prefix, file):
+    return f"uploads/{prefix}_{secure_filename(file.filename)}"
+
+
+# 上传的图片在后台生成多种宽度的 WebP，完成后写回对应的 *_srcset 列/设置
+SRCSET_COLUMNS = [
+    ("products", "main_image"),
+    ("products", "a_plus_images"),
+    ("categories", "image"),
+    ("feedback", "image"),
+]
+SRCSET_SETTINGS = [
+    "hero_banner_upload",
+    "home_slogan_img",
+    "deals_banner_upload",
+    "new_banner_upload",
+    "about_image_1",
+    "about_image_2",
+    "about_image_3",
+]
+
+
+def build_srcsets(table, column, row_id, value):
+    """Store srcsets for ``value`` (comma-separated URLs) if it is still current."""
+    srcsets = "\n".join(image_pipeline.srcset(url) for url in value.split(","))
+    conn = db_pool.getconn()
+    try:
+        c = conn.cursor()
+        if table == "settings":
+            c.execute(
+                "INSERT INTO settings (key, value) SELECT %s, %s WHERE EXISTS (SELECT 1 FROM settings WHERE key = %s AND value = %s) ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value RETURNING key",
+                (f"{row_id}_srcset", srcsets, row_id, value),
+            )
+        else:
+            c.execute(
+                f"UPDATE {table} SET {column}_srcset = %s WHERE id = %s AND {column} = %s RETURNING *",
+                (srcsets, row_id, value),
+            )
+        row = c.fetchone()
+        if row is None:
+            # 处理期间图片已被替换或删除，丢弃生成的缩略图
+            conn.rollback()
+            originals = value.split(",")
+            blob_io.delete_later(
+                url for url in srcset_urls(srcsets) if url not in originals
+            )
+        elif table == "products":
+            commit_catalog_change(conn, "products", f"product:{row_id}")
+        elif table == "feedback":
+            commit_catalog_change(conn, f"product:{row['product_id']}")
+        else:
+            commit_nav_change(conn)
+    finally:
+        db_pool.putconn(conn)
+
+
+def queue_srcsets(table, column, row_id, value):
+    if value:
+        image_pipeline.submit(build_srcsets, table, column, row_id, value)
 
 
 @app.route("/admin/delete/category/<int:cat_id>")
@@ -263,17 +1258,12 @@ def submit_order():
 def delete_category(cat_id):
     conn = get_db_conn()
     c = conn.cursor()
-    # Also delete image from blob storage
-    c.execute("SELECT image FROM categories WHERE id = %s", (cat_id,))
-    image_url = c.fetchone()["image"]
-    if image_url:
-        try:
-            delete(image_url)
-        except Exception as e:
-            flash(f"Could not delete image from blob storage: {e}", "error")
+    c.execute("SELECT image, image_srcset FROM categories WHERE id = %s", (cat_id,))
+    category = c.fetchone()
     c.execute("DELETE FROM categories WHERE id = %s", (cat_id,))
-    conn.commit()
-    conn.close()
+    commit_nav_change(conn)
+    # Also delete image from blob storage, once the row is gone
+    blob_io.delete_later([category["image"]] + srcset_urls(category["image_srcset"]))
     return redirect(url_for("admin", tab="categories"))
 
 
@@ -283,81 +1273,74 @@ def delete_product(product_id):
     conn = get_db_conn()
     c = conn.cursor()
     c.execute(
-        "SELECT main_image, a_plus_images FROM products WHERE id = %s", (product_id,)
+        "SELECT main_image, a_plus_images, main_image_srcset, a_plus_images_srcset FROM products WHERE id = %s",
+        (product_id,),
     )
     product = c.fetchone()
-    if product["main_image"]:
-        try:
-            delete(product["main_image"])
-        except Exception as e:
-            flash(f"Could not delete main image from blob storage: {e}", "error")
-    if product["a_plus_images"]:
-        urls = product["a_plus_images"].split(",")
-        try:
-            delete(urls)
-        except Exception as e:
-            flash(f"Could not delete A+ images from blob storage: {e}", "error")
-
     c.execute("DELETE FROM products WHERE id = %s", (product_id,))
-    conn.commit()
-    conn.close()
+    commit_catalog_change(conn, "products", f"product:{product_id}")
+    blob_io.delete_later(
+        [product["main_image"]]
+        + (product["a_plus_images"] or "").split(",")
+        + srcset_urls(product["main_image_srcset"])
+        + srcset_urls(product["a_plus_images_srcset"])
+    )
     return redirect(url_for("admin", tab="products"))
 
 
 @app.route("/admin/edit_product/<int:product_id>", methods=["GET", "POST"])
 @admin_required
 def edit_product(product_id):
-    conn = get_db_conn()
-    c = conn.cursor()
     if request.method == "POST":
+        # 先并发上传新图片，上传完成后才占用数据库连接
+        main_img_file = request.files.get("main_image")
+        new_main = main_img_file and main_img_file.filename
+        a_plus_files = [
+            f for f in request.files.getlist("a_plus_images") if f and f.filename
+        ]
+        uploads = [(upload_path("aplus", f), f) for f in a_plus_files]
+        if new_main:
+            uploads.insert(0, (upload_path("main", main_img_file), main_img_file))
+        urls = blob_io.put_many(uploads)
+
+        conn = get_db_conn()
+        c = conn.cursor()
         c.execute(
-            "SELECT main_image, a_plus_images FROM products WHERE id = %s",
+            "SELECT main_image, a_plus_images, main_image_srcset, a_plus_images_srcset FROM products WHERE id = %s",
             (product_id,),
         )
         product_data = c.fetchone()
 
+        replaced = []
         main_image_url = product_data["main_image"]
-        main_img_file = request.files.get("main_image")
-        if main_img_file and main_img_file.filename:
-            if main_image_url:  # Delete old one
-                try:
-                    delete(main_image_url)
-                except Exception as e:
-                    flash(f"Could not delete old main image: {e}", "error")
-            filename = "main_" + secure_filename(main_img_file.filename)
-            blob = put(f"uploads/{filename}", main_img_file.read())
-            main_image_url = blob["url"]
+        main_srcset = product_data["main_image_srcset"]
+        if new_main:
+            replaced.append(main_image_url)
+            replaced.extend(srcset_urls(main_srcset))
+            main_image_url, main_srcset = urls.pop(0), ""
 
         a_plus_urls = product_data["a_plus_images"]
-        a_plus_files = request.files.getlist("a_plus_images")
-        if a_plus_files and a_plus_files[0].filename:  # If new files are uploaded
-            if a_plus_urls:  # Delete old ones
-                try:
-                    delete(a_plus_urls.split(","))
-                except Exception as e:
-                    flash(f"Could not delete old A+ images: {e}", "error")
-
-            new_urls = []
-            for file in a_plus_files:
-                if file and file.filename:
-                    fname = "aplus_" + secure_filename(file.filename)
-                    blob = put(f"uploads/{fname}", file.read())
-                    new_urls.append(blob["url"])
-            a_plus_urls = ",".join(new_urls)
+        a_plus_srcsets = product_data["a_plus_images_srcset"]
+        if a_plus_files:  # If new files are uploaded
+            replaced.extend((a_plus_urls or "").split(","))
+            replaced.extend(srcset_urls(a_plus_srcsets))
+            a_plus_urls, a_plus_srcsets = ",".join(urls), ""
 
         c.execute(
-            """UPDATE products SET category_id=%s, title_en=%s, title_zh=%s, price=%s, main_image=%s, bullet_points_en=%s, bullet_points_zh=%s, description_en=%s, description_zh=%s, a_plus_images=%s, monthly_sales=%s, avg_rating=%s, is_new=%s, is_deal=%s, is_featured=%s WHERE id=%s""",
+            """UPDATE products SET category_id=%s, title_en=%s, title_zh=%s, price=%s, main_image=%s, main_image_srcset=%s, bullet_points_en=%s, bullet_points_zh=%s, description_en=%s, description_zh=%s, a_plus_images=%s, a_plus_images_srcset=%s, monthly_sales=%s, avg_rating=%s, is_new=%s, is_deal=%s, is_featured=%s WHERE id=%s""",
             (
                 request.form.get("category_id"),
                 request.form.get("title_en"),
                 request.form.get("title_zh"),
                 request.form.get("price"),
                 main_image_url,
+                main_srcset,
                 request.form.get("bullet_points_en", ""),
                 request.form.get("bullet_points_zh", ""),
                 request.form.get("description_en", ""),
                 request.form.get("description_zh", ""),
                 a_plus_urls,
+                a_plus_srcsets,
                 request.form.get("monthly_sales", 0),
                 request.form.get("avg_rating", 5.0),
                 1 if request.form.get("is_new") == "on" else 0,
@@ -366,122 +1349,111 @@ def edit_product(product_id):
                 product_id,
             ),
         )
-        conn.commit()
-        conn.close()
+        commit_catalog_change(conn, "products", f"product:{product_id}")
+        blob_io.delete_later(replaced)
+        if new_main:
+            queue_srcsets("products", "main_image", product_id, main_image_url)
+        if a_plus_files:
+            queue_srcsets("products", "a_plus_images", product_id, a_plus_urls)
         return redirect(url_for("admin"))
 
+    conn = get_db_conn()
+    c = conn.cursor()
     c.execute("SELECT * FROM products WHERE id = %s", (product_id,))
     product = c.fetchone()
     c.execute("SELECT id, name_zh, name_en FROM categories")
     categories_list = c.fetchall()
-    conn.close()
-    a_plus_imgs = (
-        product["a_plus_images"].split(",") if product["a_plus_images"] else []
-    )
     return render_template(
         "edit_product.html",
         product=product,
         categories_list=categories_list,
-        a_plus_imgs=a_plus_imgs,
+        a_plus_imgs=product["a_plus_image_list"],
     )
 
 
 @app.route("/admin/edit_category/<int:cat_id>", methods=["GET", "POST"])
 @admin_required
 def edit_category(cat_id):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM categories WHERE id = %s", (cat_id,))
-    category = c.fetchone()
     if request.method == "POST":
-        cat_image_url = category["image"]
-
-        if request.form.get("delete_image") == "on":
-            if cat_image_url:
-                try:
-                    delete(cat_image_url)
-                except Exception as e:
-                    flash(f"Could not delete image: {e}", "error")
-            cat_image_url = ""
-        else:
-            cat_img_file = request.files.get("category_image")
-            if cat_img_file and cat_img_file.filename:
-                if cat_image_url:  # Delete old one
-                    try:
-                        delete(cat_image_url)
-                    except Exception as e:
-                        flash(f"Could not delete old image: {e}", "error")
-                cat_filename = "cat_" + secure_filename(cat_img_file.filename)
-                blob = put(f"uploads/{cat_filename}", cat_img_file.read())
-                cat_image_url = blob["url"]
+        delete_image = request.form.get("delete_image") == "on"
+        new_image_url = None
+        cat_img_file = request.files.get("category_image")
+        if not delete_image and cat_img_file and cat_img_file.filename:
+            new_image_url = blob_io.put(upload_path("cat", cat_img_file), cat_img_file)
+
+        conn = get_db_conn()
+        c = conn.cursor()
+        c.execute("SELECT image, image_srcset FROM categories WHERE id = %s", (cat_id,))
+        category = c.fetchone()
+        cat_image_url, cat_srcset = category["image"], category["image_srcset"]
+        replaced = []
+        if delete_image or new_image_url:
+            replaced.append(cat_image_url)
+            replaced.extend(srcset_urls(cat_srcset))
+            cat_image_url, cat_srcset = new_image_url or "", ""
 
         c.execute(
-            "UPDATE categories SET name_en=%s, name_zh=%s, slug=%s, image=%s, sort_order=%s WHERE id=%s",
+            "UPDATE categories SET name_en=%s, name_zh=%s, slug=%s, image=%s, image_srcset=%s, sort_order=%s WHERE id=%s",
             (
                 request.form.get("name_en"),
                 request.form.get("name_zh"),
                 request.form.get("slug", "").lower().replace(" ", "-"),
                 cat_image_url,
+                cat_srcset,
                 request.form.get("sort_order", 0),
                 cat_id,
             ),
         )
-        conn.commit()
-        conn.close()
+        commit_nav_change(conn)
+        blob_io.delete_later(replaced)
+        if new_image_url:
+            queue_srcsets("categories", "image", cat_id, new_image_url)
         return redirect(url_for("admin", tab="categories"))
-    conn.close()
+
+    conn = get_db_conn()
+    c = conn.cursor()
+    c.execute("SELECT * FROM categories WHERE id = %s", (cat_id,))
+    category = c.fetchone()
     return render_template("edit_category.html", category=category)
 
 
 @app.route("/admin", methods=["GET", "POST"])
 @admin_required
 def admin():
-    conn = get_db_conn()
-    c = conn.cursor()
-
-    def handle_single_upload(file_key, setting_key, delete_key, prefix):
-        old_url = g.settings.get(setting_key)
-        if request.form.get(delete_key) == "on":
-            if old_url:
-                try:
-                    delete(old_url)
-                except Exception as e:
-                    flash(f"Could not delete blob: {e}", "error")
-            c.execute(
-                "INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value",
-                (setting_key, ""),
-            )
-        else:
-            img_file = request.files.get(file_key)
-            if img_file and img_file.filename:
-                if old_url:
-                    try:
-                        delete(old_url)
-                    except Exception as e:
-                        flash(f"Could not delete old blob: {e}", "error")
-                img_filename = prefix + "_" + secure_filename(img_file.filename)
-                blob = put(f"uploads/{img_filename}", img_file.read())
-                c.execute(
-                    "INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value",
-                    (setting_key, blob["url"]),
-                )
-
     if request.method == "POST":
         action = request.form.get("admin_action")
 
         if action == "UPDATE_SETTINGS":
+            updates = {}
+            uploads = []  # (setting_key, path, file)
+            replaced = []
+
+            def replace_setting_image(setting_key):
+                replaced.append(g.settings.get(setting_key))
+                if setting_key in SRCSET_SETTINGS:
+                    srcset_key = f"{setting_key}_srcset"
+                    replaced.extend(srcset_urls(g.settings.get(srcset_key)))
+                    updates[srcset_key] = ""
+
+            def handle_single_upload(file_key, setting_key, delete_key, prefix):
+                if request.form.get(delete_key) == "on":
+                    updates[setting_key] = ""
+                    replace_setting_image(setting_key)
+                else:
+                    img_file = request.files.get(file_key)
+                    if img_file and img_file.filename:
+                        updates[setting_key] = None  # 上传完成后填入 URL
+                        uploads.append(
+                            (setting_key, upload_path(prefix, img_file), img_file)
+                        )
+                        replace_setting_image(setting_key)
+
             handle_single_upload("site_logo_file", "site_logo", "delete_logo", "logo")
 
             banner_type = request.form.get("hero_banner_type")
-            c.execute(
-                "INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value",
-                ("hero_banner_type", banner_type),
-            )
+            updates["hero_banner_type"] = banner_type
             if banner_type == "url":
-                c.execute(
-                    "INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value",
-                    ("hero_banner_url", request.form.get("hero_banner_url", "")),
-                )
+                updates["hero_banner_url"] = request.form.get("hero_banner_url", "")
             else:
                 handle_single_upload(
                     "hero_banner_upload_file",
@@ -517,6 +1489,10 @@ def admin():
                     f"about_{i}",
                 )
 
+            urls = blob_io.put_many([(path, f) for _, path, f in uploads])
+            for (setting_key, _, _), url in zip(uploads, urls):
+                updates[setting_key] = url
+
             excluded = [
                 "admin_action",
                 "csrf_token",
@@ -538,37 +1514,40 @@ def admin():
                 "delete_about_image_3",
                 "hero_banner_url",
                 "hero_banner_type",
+                NAV_GENERATION_KEY,
+                CATALOG_GENERATION_KEY,
             ]
 
             for key, value in request.form.items():
                 if key not in excluded:
-                    c.execute(
-                        "INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value",
-                        (key, value),
-                    )
-
-            conn.commit()
+                    updates[key] = value
+
+            conn = get_db_conn()
+            if save_settings(conn.cursor(), updates):
+                commit_nav_change(conn)
+            blob_io.delete_later(replaced)
+            for setting_key, url in zip((key for key, _, _ in uploads), urls):
+                if setting_key in SRCSET_SETTINGS:
+                    queue_srcsets("settings", "value", setting_key, url)
             return redirect(url_for("admin", tab="settings"))
 
         elif action == "ADD_PRODUCT":
-            main_image_url = ""
             main_img_file = request.files.get("main_image")
-            if main_img_file and main_img_file.filename:
-                filename = "main_" + secure_filename(main_img_file.filename)
-                blob = put(f"uploads/{filename}", main_img_file.read())
-                main_image_url = blob["url"]
-
-            a_plus_urls = []
-            a_plus_files = request.files.getlist("a_plus_images")
-            for file in a_plus_files:
-                if file and file.filename:
-                    fname = "aplus_" + secure_filename(file.filename)
-                    blob = put(f"uploads/{fname}", file.read())
-                    a_plus_urls.append(blob["url"])
-            a_plus_str = ",".join(a_plus_urls)
-
+            has_main = main_img_file and main_img_file.filename
+            a_plus_files = [
+                f for f in request.files.getlist("a_plus_images") if f and f.filename
+            ]
+            uploads = [(upload_path("aplus", f), f) for f in a_plus_files]
+            if has_main:
+                uploads.insert(0, (upload_path("main", main_img_file), main_img_file))
+            urls = blob_io.put_many(uploads)
+            main_image_url = urls.pop(0) if has_main else ""
+            a_plus_str = ",".join(urls)
+
+            conn = get_db_conn()
+            c = conn.cursor()
             c.execute(
-                """INSERT INTO products (category_id, title_en, title_zh, price, main_image, bullet_points_en, bullet_points_zh, description_en, description_zh, a_plus_images, monthly_sales, avg_rating, is_new, is_deal, is_featured) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+                """INSERT INTO products (category_id, title_en, title_zh, price, main_image, bullet_points_en, bullet_points_zh, description_en, description_zh, a_plus_images, monthly_sales, avg_rating, is_new, is_deal, is_featured) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id""",
                 (
                     request.form.get("category_id"),
                     request.form.get("title_en"),
@@ -587,19 +1566,24 @@ def admin():
                     1 if request.form.get("is_featured") == "on" else 0,
                 ),
             )
-            conn.commit()
+            product_id = c.fetchone()["id"]
+            commit_catalog_change(conn, "products")
+            queue_srcsets("products", "main_image", product_id, main_image_url)
+            queue_srcsets("products", "a_plus_images", product_id, a_plus_str)
             return redirect(url_for("admin", tab="products"))
 
         elif action == "ADD_CATEGORY":
             cat_image_url = ""
             cat_img_file = request.files.get("category_image")
             if cat_img_file and cat_img_file.filename:
-                cat_filename = "cat_" + secure_filename(cat_img_file.filename)
-                blob = put(f"uploads/{cat_filename}", cat_img_file.read())
-                cat_image_url = blob["url"]
+                cat_image_url = blob_io.put(
+                    upload_path("cat", cat_img_file), cat_img_file
+                )
 
+            conn = get_db_conn()
+            c = conn.cursor()
             c.execute(
-                "INSERT INTO categories (name_en, name_zh, slug, image, sort_order) VALUES (%s, %s, %s, %s, %s)",
+                "INSERT INTO categories (name_en, name_zh, slug, image, sort_order) VALUES (%s, %s, %s, %s, %s) RETURNING id",
                 (
                     request.form.get("name_en"),
                     request.form.get("name_zh"),
@@ -608,7 +1592,9 @@ def admin():
                     request.form.get("sort_order", 0),
                 ),
             )
-            conn.commit()
+            cat_id = c.fetchone()["id"]
+            commit_nav_change(conn)
+            queue_srcsets("categories", "image", cat_id, cat_image_url)
             return redirect(url_for("admin", tab="categories"))
 
         elif action == "ADD_FEEDBACK":
@@ -620,32 +1606,37 @@ def admin():
             else:
                 feedback_img_file = request.files.get("feedback_image")
                 if feedback_img_file and feedback_img_file.filename:
-                    img_filename = "fb_" + secure_filename(feedback_img_file.filename)
-                    blob = put(f"uploads/{img_filename}", feedback_img_file.read())
-                    img_url = blob["url"]
+                    img_url = blob_io.put(
+                        upload_path("fb", feedback_img_file), feedback_img_file
+                    )
 
+            product_id = request.form.get("product_id", type=int)
+            rating = request.form.get("rating", 5.0, type=float)
+            conn = get_db_conn()
+            c = conn.cursor()
             c.execute(
-                "INSERT INTO feedback (product_id, rating, text_en, text_zh, image) VALUES (%s, %s, %s, %s, %s)",
+                "INSERT INTO feedback (product_id, rating, text_en, text_zh, image) VALUES (%s, %s, %s, %s, %s) RETURNING id",
                 (
-                    request.form.get("product_id"),
-                    request.form.get("rating", 5.0),
+                    product_id,
+                    rating,
                     request.form.get("text_en", ""),
                     request.form.get("text_zh", ""),
                     img_url,
                 ),
             )
-            conn.commit()
+            feedback_id = c.fetchone()["id"]
+            # 同一事务内增量更新商品的评价统计
+            stars = min(max(int(rating + 0.5), 1), 5)
+            c.execute(
+                f"UPDATE products SET review_count = review_count + 1, review_rating_sum = review_rating_sum + %s, review_stars_{stars} = review_stars_{stars} + 1 WHERE id = %s",
+                (rating, product_id),
+            )
+            commit_catalog_change(conn, f"product:{product_id}")
+            if image_type != "url":
+                queue_srcsets("feedback", "image", feedback_id, img_url)
             return redirect(url_for("admin", tab="feedback"))
 
-    c.execute("SELECT * FROM orders ORDER BY id DESC")
-    orders = c.fetchall()
-    c.execute("SELECT * FROM categories ORDER BY sort_order DESC, id DESC")
-    categories_list = c.fetchall()
-    c.execute(
-        "SELECT p.*, c.name_zh as category_name_zh, c.name_en as category_name_en FROM products p LEFT JOIN categories c ON p.category_id = c.id ORDER BY p.id DESC"
-    )
-    products_list = c.fetchall()
-
+    # 订单和产品表格由页面按需从 /admin/api/* 分页加载
     about_images_data = [
         {
             "key": f"about_image_{i}",
@@ -657,14 +1648,350 @@ def admin():
     ]
 
     active_tab = request.args.get("tab", "products")
-    conn.close()
     return render_template(
         "admin.html",
-        orders=orders,
-        categories_list=categories_list,
-        products_list=products_list,
+        categories_list=g.categories,
         categories=g.categories,
         settings_dict=g.settings,
         about_images_data=about_images_data,
         active_tab=active_tab,
     )
+
+
+# --- 批量导入/导出 ---
+IMPORT_BATCH_SIZE = 500
+IMPORT_IMAGE_COLUMNS = ("main_image", "a_plus_images")
+EXPORTS = {
+    "products": catalog_io.PRODUCT_COLUMNS,
+    "orders": catalog_io.ORDER_COLUMNS,
+}
+
+
+def is_url(value):
+    return "://" in value or value.startswith("/")
+
+
+def upload_import_images(batch, archive, uploaded):
+    """Replace image names from the zip with blob URLs, uploading new ones.
+
+    The batch's images upload concurrently; ``uploaded`` maps names already
+    uploaded by earlier batches to their URLs.
+    """
+    names = []
+    for line, product in batch:
+        for column in IMPORT_IMAGE_COLUMNS:
+            for name in (product.get(column) or "").split(","):
+                if not name or is_url(name) or name in uploaded or name in names:
+                    continue
+                try:
+                    archive.getinfo(name)
+                except (AttributeError, KeyError):
+                    raise catalog_io.RowError(line, f"image {name} is not in the zip")
+                names.append(name)
+    files = [archive.open(name) for name in names]
+    try:
+        urls = blob_io.put_many(
+            [
+                (f"uploads/import_{secure_filename(name)}", f)
+                for name, f in zip(names, files)
+            ]
+        )
+    finally:
+        for f in files:
+            f.close()
+    uploaded.update(zip(names, urls))
+    for _, product in batch:
+        for column in IMPORT_IMAGE_COLUMNS:
+            if product.get(column):
+                product[column] = ",".join(
+                    uploaded.get(name, name) for name in product[column].split(",")
+                )
+
+
+def upsert_product_batch(c, batch):
+    """Insert new and update existing products of ``batch`` in bulk.
+
+    Returns ``(ids, replaced, new_images)``: the ids written, image URLs no
+    longer referenced, and ``(id, column, value)`` of images that need
+    responsive variants. A row whose ``id`` is not in the table is a new
+    product and needs the same columns as one without an id.
+    """
+    updated_ids = [product["id"] for _, product in batch if "id" in product]
+    old = {}
+    if updated_ids:
+        c.execute(
+            "SELECT id, main_image, a_plus_images, main_image_srcset, a_plus_images_srcset FROM products WHERE id = ANY(%s)",
+            (updated_ids,),
+        )
+        old = {row["id"]: row for row in c.fetchall()}
+
+    # 每组列相同的行合并为一条多行 INSERT ... ON CONFLICT
+    groups = {}
+    for line, product in batch:
+        if "id" in product and product["id"] not in old:
+            catalog_io.check_new_product(line, product)
+        groups.setdefault(tuple(product), []).append(product)
+    ids, replaced, new_images = [], [], []
+    # 自带 id 的组先写，写完把序列推到最大 id 之后，没有 id 的行取 nextval 时才不会撞上
+    for columns, products in sorted(groups.items(), key=lambda g: "id" not in g[0]):
+        sql = f"INSERT INTO products ({', '.join(columns)}) VALUES %s"
+        if "id" in columns:
+            sets = [f"{col} = EXCLUDED.{col}" for col in columns if col != "id"]
+            sets += [
+                f"{col}_srcset = CASE WHEN products.{col} IS DISTINCT FROM EXCLUDED.{col} THEN '' ELSE products.{col}_srcset END"
+                for col in IMPORT_IMAGE_COLUMNS
+                if col in columns
+            ]
+            sql += " ON CONFLICT (id) DO UPDATE SET " + ", ".join(sets)
+        rows = execute_values(
+            c,
+            sql + " RETURNING id",
+            [tuple(product[col] for col in columns) for product in products],
+            fetch=True,
+        )
+        if "id" in columns:
+            c.execute(
+                "SELECT setval(pg_get_serial_sequence('products', 'id'), coalesce(max(id), 1)) FROM products"
+            )
+        for product, row in zip(products, rows):
+            ids.append(row[0])
+            previous = old.get(row[0])
+            for col in IMPORT_IMAGE_COLUMNS:
+                if col not in product or (
+                    previous is not None and previous[col] == product[col]
+                ):
+                    continue
+                new_images.append((row[0], col, product[col]))
+                if previous is not None:
+                    kept = set(product[col].split(","))
+                    replaced.extend(
+                        url
+                        for url in (previous[col] or "").split(",")
+                        + srcset_urls(previous[f"{col}_srcset"])
+                        if url not in kept
+                    )
+    return ids, replaced, new_images
+
+
+@app.route("/admin/import/products", methods=["POST"])
+@admin_required
+def import_products():
+    """Bulk upsert products from a CSV/JSONL file, images from an optional zip.
+
+    The whole file is imported in one transaction, or not at all. Progress is
+    streamed back as JSON lines.
+    """
+    request.max_content_length = app.config["IMPORT_MAX_CONTENT_LENGTH"]
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        abort(400)
+    # Flask closes uploaded files when the view returns, before a streamed
+    # response is read; take the file objects over so they stay open.
+    stream, upload.stream = upload.stream, io.BytesIO()
+    images = request.files.get("images")
+    archive = None
+    if images and images.filename:
+        try:
+            archive = zipfile.ZipFile(images.stream)
+        except zipfile.BadZipFile:
+            abort(400)
+        images.stream = io.BytesIO()
+
+    def run():
+        conn = get_db_conn()
+        c = conn.cursor()
+        uploaded, ids, replaced, new_images = {}, [], [], []
+
+        def flush(batch):
+            upload_import_images(batch, archive, uploaded)
+            batch_ids, batch_replaced, batch_images = upsert_product_batch(c, batch)
+            ids.extend(batch_ids)
+            replaced.extend(batch_replaced)
+            new_images.extend(batch_images)
+
+        try:
+            batch = []
+            for line, record in catalog_io.read_records(stream, upload.filename):
+                batch.append((line, catalog_io.clean_product(line, record)))
+                if len(batch) == IMPORT_BATCH_SIZE:
+                    flush(batch)
+                    batch = []
+                    yield json.dumps({"processed": len(ids)}) + "\n"
+            if batch:
+                flush(batch)
+            commit_catalog_change(conn, "products", *(f"product:{i}" for i in ids))
+        except Exception as e:
+            conn.rollback()
+            blob_io.delete_later(uploaded.values())
+            if not isinstance(e, catalog_io.RowError):
+                app.logger.exception("Product import failed")
+            yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+            return
+        finally:
+            stream.close()
+            if archive is not None:
+                archive.close()
+        blob_io.delete_later(replaced)
+        for product_id, column, value in new_images:
+            queue_srcsets("products", column, product_id, value)
+        yield json.dumps({"done": True, "processed": len(ids)}) + "\n"
+
+    return app.response_class(
+        stream_with_context(run()), mimetype="application/x-ndjson"
+    )
+
+
+@app.route("/admin/export/<table>.<fmt>")
+@admin_required
+def export_table(table, fmt):
+    """Stream a whole table as CSV or JSONL through a server-side cursor."""
+    columns = EXPORTS.get(table)
+    if columns is None or fmt not in ("csv", "jsonl"):
+        abort(404)
+
+    def rows():
+        c = server_cursor(get_db_conn(), f"export_{table}")
+        c.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY id")
+        yield from c
+
+    encode = catalog_io.encode_csv if fmt == "csv" else catalog_io.encode_jsonl
+    return app.response_class(
+        stream_with_context(encode(columns, rows())),
+        mimetype="text/csv" if fmt == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename={table}.{fmt}"},
+    )
+
+
+# --- 静态快照 ---
+def storefront_pages():
+    """``(url, tags)`` of every public page, tagged like cached_page does."""
+    conn = db_pool.getconn()
+    try:
+        c = conn.cursor()
+        c.execute("SELECT slug FROM categories WHERE slug <> '' ORDER BY id")
+        slugs = [row[0] for row in c.fetchall()]
+        c.execute("SELECT id FROM products ORDER BY id")
+        product_ids = [row[0] for row in c.fetchall()]
+        conn.rollback()
+    finally:
+        db_pool.putconn(conn)
+    pages = [
+        ("/", ["products"]),
+        ("/about", []),
+        ("/catalog", []),
+        ("/deals", ["products"]),
+        ("/new_arrivals", ["products"]),
+    ]
+    pages += [(f"/catalog/{quote(slug)}", ["products"]) for slug in slugs]
+    pages += [(f"/product/{i}", [f"product:{i}"]) for i in product_ids]
+    return pages
+
+
+# 设置 STATIC_EXPORT_DIR 时，后台每次保存后只重新导出受影响的页面
+static_snapshot = (
+    StaticSnapshot(app, os.environ["STATIC_EXPORT_DIR"], storefront_pages)
+    if os.environ.get("STATIC_EXPORT_DIR")
+    else None
+)
+
+
+# --- 启动预热 ---
+WARMUP_PAGES = ("/", "/catalog", "/deals", "/new_arrivals")
+
+
+def warm_up(connections=None):
+    """Get the process ready for traffic, then mark it ready.
+
+    Compiles every template, pre-opens ``connections`` database connections
+    per pool (one per server thread) and renders the top pages in every
+    language once, which loads the nav, settings and featured products and
+    fills the page and fragment caches. Raises if a page fails to render.
+    """
+    started = time.perf_counter()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    db_pool.open(connections)
+    replicas.open(connections)
+    client = app.test_client()
+    for lang in LANGUAGES:
+        for path in WARMUP_PAGES:
+            response = client.get(f"/{lang}{path}")
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f"warm-up: /{lang}{path} returned {response.status_code}"
+                )
+    ready.set()
+    app.logger.info("Warmed up in %.2fs", time.perf_counter() - started)
+
+
+# --- 命令行 (部署时运行) ---
+
+
+@app.cli.command("migrate")
+def migrate_command():
+    """Apply pending schema migrations."""
+    conn = db_pool.getconn()
+    try:
+        migrate.upgrade(conn, log=click.echo)
+    finally:
+        db_pool.putconn(conn)
+
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    """Fail if a hot public query would need a sequential scan."""
+    conn = db_pool.getconn()
+    try:
+        failures = migrate.check_query_plans(conn)
+    finally:
+        db_pool.putconn(conn)
+    for name, tables in failures:
+        click.echo(f"{name}: sequential scan on {', '.join(tables)}", err=True)
+    if failures:
+        raise SystemExit(1)
+    click.echo(f"All {len(migrate.HOT_QUERIES)} hot queries use an index.")
+
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    """Minify, fingerprint and precompress the files under static/."""
+    for source, target in asset_pipeline.build().items():
+        click.echo(f"{source} -> {target}")
+
+
+@app.cli.command("export-static")
+@click.argument("directory")
+def export_static_command(directory):
+    """Render every public page, in every language, into DIRECTORY."""
+    count = StaticSnapshot(app, directory, storefront_pages).export()
+    click.echo(f"Exported {count} pages to {directory}")
+
+
+@app.cli.command("backfill-images")
+def backfill_images_command():
+    """Generate responsive image variants for images that have none yet."""
+    jobs = []
+    conn = db_pool.getconn()
+    try:
+        c = conn.cursor()
+        for table, column in SRCSET_COLUMNS:
+            c.execute(
+                f"SELECT id, {column} FROM {table} WHERE {column} <> '' AND {column}_srcset = ''"
+            )
+            jobs.extend((table, column, row[0], row[1]) for row in c.fetchall())
+        c.execute("SELECT key, value FROM settings")
+        settings = {row["key"]: row["value"] for row in c.fetchall()}
+        conn.rollback()
+    finally:
+        db_pool.putconn(conn)
+    for key in SRCSET_SETTINGS:
+        if settings.get(key) and not settings.get(f"{key}_srcset"):
+            jobs.append(("settings", "value", key, settings[key]))
+
+    for table, column, row_id, value in jobs:
+        try:
+            build_srcsets(table, column, row_id, value)
+            click.echo(f"{table} {row_id} {column}: done")
+        except Exception as e:
+            click.echo(f"{table} {row_id} {column}: {e}", err=True)
+    blob_io.join()
@@ -0,0 +1,129 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+
+try:
+    import brotli
+except ImportError:  # 没装 brotli 时只生成 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+BUILD_DIR = "dist"
+MANIFEST = "manifest.json"
+# 不参与构建的 static 子目录：构建产物本身和本地 blob 上传目录
+SKIP_DIRS = {BUILD_DIR, "uploads"}
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html"}
+
+
+def minify_css(text):
+    """Drop comments and the whitespace CSS does not need.
+
+    Deliberately conservative: whitespace is only removed around ``{ } ; ,
+    >`` and after ``:``, never where it separates tokens (``calc(a + b)``,
+    descendant selectors).
+    """
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s*([{};,>])\s*", r"\1", text)
+    text = re.sub(r":\s+", ":", text)
+    return text.replace(";}", "}").strip() + "\n"
+
+
+MINIFIERS = {".css": minify_css}
+
+
+def atomic_write(path, data):
+    # 先写临时文件再改名：多个进程同时构建时不会读到写了一半的文件
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class AssetPipeline:
+    """Content-hashed, minified and precompressed copies of the static files.
+
+    ``build()`` writes ``<name>.<hash><ext>`` plus ``.gz`` and ``.br``
+    variants under ``static/dist/`` and returns the manifest mapping each
+    source file to its hashed name. Hashed names change whenever the
+    content does, so they can be cached by browsers forever.
+    """
+
+    def __init__(self, static_dir):
+        self.static_dir = static_dir
+        self.build_dir = os.path.join(static_dir, BUILD_DIR)
+        self.manifest = {}
+
+    def sources(self):
+        for root, dirs, files in os.walk(self.static_dir):
+            if root == self.static_dir:
+                dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if not name.startswith("."):
+                    path = os.path.join(root, name)
+                    yield os.path.relpath(path, self.static_dir).replace(os.sep, "/")
+
+    def build(self):
+        os.makedirs(self.build_dir, exist_ok=True)
+        manifest = {}
+        for source in sorted(self.sources()):
+            with open(os.path.join(self.static_dir, source), "rb") as f:
+                data = f.read()
+            stem, ext = os.path.splitext(source)
+            minify = MINIFIERS.get(ext.lower())
+            if minify is not None:
+                data = minify(data.decode("utf-8")).encode("utf-8")
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            target = f"{stem}.{digest}{ext}"
+            path = os.path.join(self.build_dir, target)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if ext.lower() in COMPRESSIBLE:
+                    atomic_write(path + ".gz", gzip.compress(data, 9, mtime=0))
+                    if brotli is not None:
+                        atomic_write(path + ".br", brotli.compress(data))
+                atomic_write(path, data)
+            manifest[source] = f"{BUILD_DIR}/{target}"
+        atomic_write(
+            os.path.join(self.build_dir, MANIFEST),
+            json.dumps(manifest, indent=2).encode("utf-8"),
+        )
+        self.manifest = manifest
+        return manifest
+
+    def load(self):
+        """Build, or fall back to the last manifest if static/ is read-only."""
+        try:
+            return self.build()
+        except OSError as e:
+            try:
+                with open(os.path.join(self.build_dir, MANIFEST), "rb") as f:
+                    self.manifest = json.load(f)
+            except (OSError, ValueError):
+                self.manifest = {}
+            logger.warning(
+                "Building static assets failed (%s); using %d prebuilt",
+                e,
+                len(self.manifest),
+            )
+            return self.manifest
+
+    def hashed(self, filename):
+        return self.manifest.get(filename)
+
+    @staticmethod
+    def is_hashed(filename):
+        return (
+            filename.startswith(BUILD_DIR + "/")
+            and filename != f"{BUILD_DIR}/{MANIFEST}"
+        )
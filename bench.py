@@ -0,0 +1,559 @@
+"""Load test for the public and admin routes.
+
+Seeds a Postgres database with a synthetic catalog, starts the app with
+run.py against it and replays a weighted traffic mix, reporting latency
+percentiles, throughput and database statements per request (read from the
+Server-Timing header). The database in BENCH_DATABASE_URL is emptied by
+``seed``; never point it at real data.
+
+    python bench.py seed --products 5000
+    python bench.py run --save bench_baseline.json
+    python bench.py run --compare bench_baseline.json
+    python bench.py run --workers 4 --threads 4
+"""
+
+import argparse
+import bisect
+import json
+import math
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import psycopg2
+import requests
+
+import migrate
+
+ADMIN_USER = os.environ.get("BENCH_ADMIN_USER", "adminJ")
+ADMIN_PASSWORD = os.environ.get("BENCH_ADMIN_PASSWORD", "141225")
+
+# fmt: off
+WORDS_EN = [
+    "dog", "cat", "bed", "bowl", "leash", "collar", "toy", "harness", "brush",
+    "feeder", "fountain", "carrier", "crate", "blanket", "treat", "chew",
+    "scratcher", "tower", "litter", "mat", "orthopedic", "waterproof",
+    "portable", "automatic", "plush", "cotton", "small", "large", "travel",
+]
+WORDS_ZH = [
+    "狗", "猫", "窝", "碗", "牵引绳", "项圈", "玩具", "胸背带", "梳子",
+    "喂食器", "饮水机", "航空箱", "笼子", "毯子", "零食", "磨牙", "猫抓板",
+    "猫爬架", "猫砂", "垫子", "防水", "便携", "自动", "毛绒", "纯棉",
+]
+# fmt: on
+
+# 流量组合：(标签, 权重)，标签对应 Client 上的同名方法
+MIXES = {
+    "browse": [
+        ("index", 25),
+        ("catalog", 20),
+        ("product", 35),
+        ("deals", 15),
+        ("submit_order", 5),
+    ],
+    "admin": [
+        ("admin", 30),
+        ("admin_orders", 30),
+        ("product", 25),
+        ("submit_order", 15),
+    ],
+}
+MIXES["mixed"] = MIXES["browse"] * 9 + MIXES["admin"]
+
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def database_url():
+    url = os.environ.get("BENCH_DATABASE_URL")
+    if not url:
+        sys.exit("Set BENCH_DATABASE_URL to a scratch Postgres database.")
+    return url
+
+
+# --- 造数据 ---
+
+
+def seed(url, categories, products, reviews, orders, seed_value):
+    conn = psycopg2.connect(url)
+    try:
+        migrate.upgrade(conn)
+        c = conn.cursor()
+        c.execute(
+            "TRUNCATE settings, categories, products, feedback, orders RESTART IDENTITY"
+        )
+        c.execute("SELECT setseed(%s)", (seed_value,))
+        c.execute(
+            """
+            INSERT INTO categories (name_en, name_zh, slug, sort_order)
+            SELECT 'Category ' || n, '分类' || n, 'category-' || n, n
+            FROM generate_series(1, %s) n
+            """,
+            (categories,),
+        )
+        # 标题由词表随机拼成，搜索和分类页才有真实的选择性
+        c.execute(
+            """
+            INSERT INTO products (
+                category_id, title_en, title_zh, price, bullet_points_en,
+                bullet_points_zh, description_en, description_zh, monthly_sales,
+                is_new, is_deal, is_featured
+            )
+            SELECT
+                1 + floor(random() * %(categories)s)::int,
+                initcap(en[1 + floor(random() * array_length(en, 1))::int] || ' '
+                    || en[1 + floor(random() * array_length(en, 1))::int] || ' '
+                    || en[1 + floor(random() * array_length(en, 1))::int]) || ' ' || n,
+                zh[1 + floor(random() * array_length(zh, 1))::int]
+                    || zh[1 + floor(random() * array_length(zh, 1))::int]
+                    || zh[1 + floor(random() * array_length(zh, 1))::int] || n,
+                to_char(5 + random() * 195, 'FM990.00'),
+                'Durable materials' || chr(10) || 'Easy to clean' || chr(10)
+                    || 'Fits most breeds',
+                '材质耐用' || chr(10) || '易于清洁' || chr(10) || '适合大多数品种',
+                repeat('A well made product for everyday use. ', 20),
+                repeat('一款适合日常使用的优质产品。', 20),
+                floor(random() * 5000)::int,
+                (random() < 0.1)::int,
+                (random() < 0.1)::int,
+                (random() < 0.02)::int
+            FROM generate_series(1, %(products)s) n,
+                (SELECT %(en)s::text[] AS en, %(zh)s::text[] AS zh) words
+            """,
+            {
+                "categories": categories,
+                "products": products,
+                "en": WORDS_EN,
+                "zh": WORDS_ZH,
+            },
+        )
+        c.execute(
+            """
+            INSERT INTO feedback (product_id, rating, text_en, text_zh)
+            SELECT
+                p,
+                least(5, 2 + floor(random() * 4)),
+                'Great quality, my pet loves it. Review ' || r,
+                '质量很好，宠物很喜欢。评价' || r
+            FROM generate_series(1, %s) p, generate_series(1, %s) r
+            """,
+            (products, reviews),
+        )
+        c.execute("""
+            UPDATE products p SET
+                review_count = s.n,
+                review_rating_sum = s.total,
+                review_stars_1 = s.stars_1,
+                review_stars_2 = s.stars_2,
+                review_stars_3 = s.stars_3,
+                review_stars_4 = s.stars_4,
+                review_stars_5 = s.stars_5
+            FROM (
+                SELECT
+                    product_id,
+                    count(*) AS n,
+                    sum(rating) AS total,
+                    count(*) FILTER (WHERE rating <= 1) AS stars_1,
+                    count(*) FILTER (WHERE rating = 2) AS stars_2,
+                    count(*) FILTER (WHERE rating = 3) AS stars_3,
+                    count(*) FILTER (WHERE rating = 4) AS stars_4,
+                    count(*) FILTER (WHERE rating >= 5) AS stars_5
+                FROM feedback
+                GROUP BY product_id
+            ) s
+            WHERE p.id = s.product_id
+            """)
+        c.execute(
+            """
+            INSERT INTO orders (product_name, customer_name, contact_info, note, date, intake_id)
+            SELECT
+                'Product ' || (1 + floor(random() * %s)::int),
+                'Customer ' || n,
+                'customer' || n || '@example.com',
+                '',
+                to_char(
+                    now() - random() * interval '365 days', 'YYYY-MM-DD HH24:MI'
+                ),
+                'seed-' || n
+            FROM generate_series(1, %s) n
+            """,
+            (products, orders),
+        )
+        conn.commit()
+        c.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# --- 压测 ---
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(url, port, threads, workers, workdir):
+    env = dict(
+        os.environ,
+        POSTGRES_URL_NON_POOLING=url,
+        SERVER_TIMING="1",
+        BLOB_LOCAL_DIR=os.path.join(workdir, "blobs"),
+        ORDER_JOURNAL_DIR=os.path.join(workdir, "order_journal"),
+        HOST="127.0.0.1",
+        PORT=str(port),
+        WAITRESS_THREADS=str(threads),
+        WEB_WORKERS=str(workers),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "run.py"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"Server exited with status {server.returncode}.")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/readyz", timeout=1).ok:
+                return server
+        except (requests.ConnectionError, requests.Timeout):
+            # 多进程时端口先于 worker 就绪，连接会挂起直到超时
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    sys.exit("Server did not start within 30 seconds.")
+
+
+def load_targets(url):
+    conn = psycopg2.connect(url)
+    try:
+        c = conn.cursor()
+        c.execute("SELECT id FROM products ORDER BY monthly_sales DESC, id")
+        product_ids = [row[0] for row in c.fetchall()]
+        c.execute("SELECT slug FROM categories ORDER BY sort_order, id")
+        slugs = [row[0] for row in c.fetchall()]
+    finally:
+        conn.close()
+    if not product_ids or not slugs:
+        sys.exit("The benchmark database is empty; run `python bench.py seed` first.")
+    return product_ids, slugs
+
+
+def machine(url):
+    """What the numbers depend on besides the options: host, CPU and Postgres."""
+    conn = psycopg2.connect(url)
+    try:
+        postgres = conn.server_version
+    finally:
+        conn.close()
+    return {
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "cpu": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "postgres": postgres,
+    }
+
+
+class Client:
+    """One simulated visitor; each method issues one request of the mix."""
+
+    def __init__(self, base, rng, product_ids, slugs):
+        self.base = base
+        self.rng = rng
+        self.session = requests.Session()
+        self.product_ids = product_ids
+        # 热门商品被访问得更多：按销量排名取 1/rank 权重
+        self.product_weights = list(
+            _accumulate(1 / rank for rank in range(1, len(product_ids) + 1))
+        )
+        self.slugs = slugs
+        self.lang = rng.choice(("en", "zh"))
+        self.logged_in = False
+
+    def pick_product(self):
+        x = self.rng.random() * self.product_weights[-1]
+        return self.product_ids[bisect.bisect(self.product_weights, x)]
+
+    def index(self):
+        return self.session.get(f"{self.base}/{self.lang}/")
+
+    def catalog(self):
+        slug = self.rng.choice(self.slugs)
+        return self.session.get(f"{self.base}/{self.lang}/catalog/{slug}")
+
+    def product(self):
+        product_id = self.pick_product()
+        return self.session.get(f"{self.base}/{self.lang}/product/{product_id}")
+
+    def deals(self):
+        return self.session.get(f"{self.base}/{self.lang}/deals")
+
+    def submit_order(self):
+        return self.session.post(
+            self.base + "/submit_order",
+            data={
+                "product_name": f"Product {self.pick_product()}",
+                "customer_name": "Bench Customer",
+                "contact": f"{uuid.uuid4().hex[:12]}@example.com",
+                "note": "",
+            },
+        )
+
+    def login(self):
+        if not self.logged_in:
+            self.session.post(
+                self.base + "/login",
+                data={"username": ADMIN_USER, "password": ADMIN_PASSWORD},
+            )
+            self.logged_in = True
+
+    def admin(self):
+        self.login()
+        return self.session.get(self.base + "/admin", allow_redirects=False)
+
+    def admin_orders(self):
+        self.login()
+        return self.session.get(self.base + "/admin/api/orders", allow_redirects=False)
+
+
+def _accumulate(values):
+    total = 0
+    for value in values:
+        total += value
+        yield total
+
+
+def run_mix(base, mix, total, concurrency, warmup, seed_value, targets):
+    labels = [label for label, _ in mix]
+    weights = [weight for _, weight in mix]
+    samples = defaultdict(list)  # label -> [(seconds, queries, ok)]
+    lock = threading.Lock()
+    per_client = -(-total // concurrency)
+    # 所有客户端预热完毕后才开始计时
+    measured = {}
+    barrier = threading.Barrier(
+        concurrency, action=lambda: measured.setdefault("start", time.perf_counter())
+    )
+
+    def worker(n):
+        rng = random.Random(seed_value * 1000 + n)
+        client = Client(base, rng, *targets)
+        plan = rng.choices(labels, weights, k=warmup + per_client)
+        local = []
+        for i, label in enumerate(plan):
+            if i == warmup:
+                barrier.wait()
+            start = time.perf_counter()
+            try:
+                response = getattr(client, label)()
+                ok = response.status_code < 300
+                timing = SERVER_TIMING_QUERIES.search(
+                    response.headers.get("Server-Timing", "")
+                )
+                queries = int(timing.group(1)) if timing else None
+            except requests.RequestException:
+                ok, queries = False, None
+            if i >= warmup:
+                local.append((label, time.perf_counter() - start, queries, ok))
+        with lock:
+            for label, seconds, queries, ok in local:
+                samples[label].append((seconds, queries, ok))
+
+    threads = [
+        threading.Thread(target=worker, args=(n,), daemon=True)
+        for n in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - measured["start"]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    # nearest-rank
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples):
+    stats = {}
+    for label, rows in samples.items():
+        latencies = sorted(seconds for seconds, _, _ in rows)
+        queries = [q for _, q, _ in rows if q is not None]
+        stats[label] = {
+            "requests": len(rows),
+            "errors": sum(1 for _, _, ok in rows if not ok),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "queries_per_request": (
+                round(sum(queries) / len(queries), 2) if queries else None
+            ),
+        }
+    return stats
+
+
+def report(result):
+    print(
+        f"{'route':<14}{'requests':>10}{'errors':>8}{'p50 ms':>10}"
+        f"{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}"
+    )
+    rows = dict(result["routes"], total=result["total"])
+    for label, s in rows.items():
+        queries = s["queries_per_request"]
+        print(
+            f"{label:<14}{s['requests']:>10}{s['errors']:>8}{s['p50_ms']:>10.1f}"
+            f"{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}"
+            f"{'-' if queries is None else format(queries, '.2f'):>9}"
+        )
+    print(f"throughput: {result['throughput_rps']:.1f} requests/s")
+
+
+def compare(result, baseline, tolerance):
+    """Lines describing where ``result`` is worse than ``baseline``."""
+    regressions = []
+    if result["config"] != baseline["config"]:
+        print("warning: baseline was recorded with a different configuration")
+    if result["machine"] != baseline.get("machine"):
+        print("warning: baseline was recorded on a different machine")
+    rows = dict(result["routes"], total=result["total"])
+    base_rows = dict(baseline["routes"], total=baseline["total"])
+    for label, s in rows.items():
+        base = base_rows.get(label)
+        if base is None:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if s[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{label} {key}: {base[key]} -> {s[key]}")
+        # 每次请求的查询数应当是确定的，多出哪怕一条都算回归
+        queries, base_queries = s["queries_per_request"], base["queries_per_request"]
+        if None not in (queries, base_queries) and queries > base_queries + 0.5:
+            regressions.append(
+                f"{label} queries_per_request: {base_queries} -> {queries}"
+            )
+        if s["errors"] > base["errors"]:
+            regressions.append(f"{label} errors: {base['errors']} -> {s['errors']}")
+    floor = baseline["throughput_rps"] / (1 + tolerance)
+    if result["throughput_rps"] < floor:
+        regressions.append(
+            f"throughput: {baseline['throughput_rps']} -> {result['throughput_rps']}"
+        )
+    return regressions
+
+
+def run(url, args):
+    targets = load_targets(url)
+    port = free_port()
+    with tempfile.TemporaryDirectory(prefix="peacepet-bench-") as workdir:
+        server = start_server(url, port, args.threads, args.workers, workdir)
+        try:
+            samples, elapsed = run_mix(
+                f"http://127.0.0.1:{port}",
+                MIXES[args.mix],
+                args.requests,
+                args.concurrency,
+                args.warmup,
+                args.seed,
+                targets,
+            )
+        finally:
+            server.terminate()
+            server.wait()
+
+    routes = summarize(samples)
+    total = summarize({"total": [row for rows in samples.values() for row in rows]})
+    result = {
+        "config": {
+            "mix": args.mix,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "threads": args.threads,
+            "workers": args.workers,
+            "products": len(targets[0]),
+            "categories": len(targets[1]),
+        },
+        "machine": machine(url),
+        "routes": routes,
+        "total": total["total"],
+        "throughput_rps": round(total["total"]["requests"] / elapsed, 1),
+    }
+    report(result)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {args.save}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("seed", help="replace the catalog with synthetic data")
+    p.add_argument("--categories", type=int, default=12)
+    p.add_argument("--products", type=int, default=2000)
+    p.add_argument("--reviews", type=int, default=10, help="reviews per product")
+    p.add_argument("--orders", type=int, default=20000)
+    p.add_argument("--seed", type=float, default=0.5, help="setseed() value, -1..1")
+
+    p = commands.add_parser("run", help="replay a traffic mix against the app")
+    p.add_argument("--mix", choices=sorted(MIXES), default="browse")
+    p.add_argument("--requests", type=int, default=2000)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--threads", type=int, default=8, help="waitress threads")
+    p.add_argument("--workers", type=int, default=1, help="server processes")
+    p.add_argument(
+        "--warmup", type=int, default=20, help="unmeasured requests per client"
+    )
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--save", metavar="FILE", help="write the results as a baseline")
+    p.add_argument("--compare", metavar="FILE", help="fail on regressions against FILE")
+    p.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed latency/throughput change against the baseline (0.2 = 20%%)",
+    )
+
+    args = parser.parse_args(argv)
+    url = database_url()
+    if args.command == "seed":
+        seed(url, args.categories, args.products, args.reviews, args.orders, args.seed)
+        print(
+            f"Seeded {args.categories} categories, {args.products} products, "
+            f"{args.products * args.reviews} reviews and {args.orders} orders."
+        )
+        return 0
+    return run(url, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+import io
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import vercel_blob
+from vercel_blob import blob_store as vercel_api  # multipart helpers
+from vercel_blob.utils import guess_mime_type
+
+logger = logging.getLogger(__name__)
+
+
+# Uploads are read from file objects in parts of this size, so an upload
+# holds at most two parts in memory however large the file is. Vercel's
+# multipart API needs every part but the last to be at least 5 MB.
+PART_SIZE = 5 * 1024 * 1024
+
+
+class VercelBlobStore:
+    def put(self, path, stream):
+        chunk = stream.read(PART_SIZE)
+        following = stream.read(PART_SIZE)
+        if not following:
+            return vercel_blob.put(path, chunk)["url"]
+
+        headers = {
+            "access": "public",
+            "authorization": f"Bearer {vercel_api._get_auth_token({})}",
+            "x-api-version": vercel_api._API_VERSION,
+            "x-content-type": guess_mime_type(path),
+            "x-cache-control-max-age": vercel_api._DEFAULT_CACHE_AGE,
+        }
+        upload = vercel_api._create_multipart_upload(path, headers, {})
+        parts = []
+        while chunk:
+            parts.append(
+                vercel_api._upload_part(
+                    path,
+                    upload["uploadId"],
+                    upload["key"],
+                    len(parts) + 1,
+                    chunk,
+                    headers,
+                    {},
+                )
+            )
+            chunk, following = following or stream.read(PART_SIZE), None
+        return vercel_api._complete_multipart_upload(
+            path, upload["uploadId"], upload["key"], parts, headers, {}
+        )["url"]
+
+    def open(self, url):
+        resp = requests.get(url, timeout=30)
+        resp.raise_for_status()
+        return io.BytesIO(resp.content)
+
+    def delete(self, urls):
+        vercel_blob.delete(urls)
+
+
+class LocalBlobStore:
+    """Stores blobs as files under ``root``; for development and tests."""
+
+    def __init__(self, root, base_url):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def put(self, path, stream):
+        # Never overwrite: give every upload a unique name.
+        stem, ext = os.path.splitext(path)
+        path = f"{stem}-{uuid.uuid4().hex[:12]}{ext}"
+        target = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            with open(target, "wb") as f:
+                shutil.copyfileobj(stream, f, PART_SIZE)
+        except BaseException:
+            os.remove(target)
+            raise
+        return f"{self.base_url}/{path}"
+
+    def _path(self, url):
+        if not url.startswith(self.base_url + "/"):
+            raise ValueError(f"{url} is not in this blob store")
+        return os.path.join(self.root, url[len(self.base_url) + 1 :])
+
+    def open(self, url):
+        return open(self._path(url), "rb")
+
+    def delete(self, urls):
+        if isinstance(urls, str):
+            urls = [urls]
+        for url in urls:
+            if url.startswith(self.base_url + "/"):
+                try:
+                    os.remove(self._path(url))
+                except FileNotFoundError:
+                    pass
+
+
+class BlobIO:
+    """Concurrent uploads and background deletes against a blob store.
+
+    ``put_many`` runs uploads on a bounded thread pool and waits for them, so
+    a request pays for its slowest upload rather than the sum. Deletes of
+    replaced images go to a queue drained by a background thread, retried
+    with backoff, so they never hold up a response. ``on_io(op, seconds)``, if
+    given, is called with the wall time of every ``put_many`` and delete.
+    """
+
+    def __init__(
+        self, store, max_workers=4, delete_attempts=5, retry_delay=2.0, on_io=None
+    ):
+        self.store = store
+        self.on_io = on_io
+        self.max_workers = max_workers
+        self.delete_attempts = delete_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        self._executor = None
+        self._deletes = queue.Queue()
+        self._delete_thread = None
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="blob-put"
+                )
+            return self._executor
+
+    def put_many(self, items):
+        """Upload ``[(path, stream)]`` concurrently; returns the URLs in order.
+
+        If any upload fails the others are queued for deletion and the first
+        error is raised.
+        """
+        if not items:
+            return []
+        start = time.perf_counter()
+        futures = [
+            self._pool().submit(self.store.put, path, stream) for path, stream in items
+        ]
+        urls, error = [], None
+        for future in futures:
+            try:
+                urls.append(future.result())
+            except Exception as e:
+                error = error or e
+        if self.on_io is not None:
+            self.on_io("put", time.perf_counter() - start)
+        if error is not None:
+            self.delete_later(urls)
+            raise error
+        return urls
+
+    def put(self, path, stream):
+        return self.put_many([(path, stream)])[0]
+
+    def delete_later(self, urls):
+        urls = list(dict.fromkeys(url for url in urls if url))
+        if not urls:
+            return
+        with self._lock:
+            if self._delete_thread is None or not self._delete_thread.is_alive():
+                self._delete_thread = threading.Thread(
+                    target=self._drain_deletes, name="blob-delete", daemon=True
+                )
+                self._delete_thread.start()
+        self._deletes.put((urls, 1))
+
+    def _drain_deletes(self):
+        while True:
+            urls, attempt = self._deletes.get()
+            start = time.perf_counter()
+            try:
+                self.store.delete(urls)
+            except Exception as e:
+                if attempt >= self.delete_attempts:
+                    logger.error("Giving up deleting blobs %s: %s", urls, e)
+                else:
+                    logger.warning("Deleting blobs %s failed, retrying: %s", urls, e)
+                    delay = self.retry_delay * 2 ** (attempt - 1)
+                    threading.Timer(
+                        delay, self._deletes.put, ((urls, attempt + 1),)
+                    ).start()
+            finally:
+                if self.on_io is not None:
+                    self.on_io("delete", time.perf_counter() - start)
+                self._deletes.task_done()
+
+    def join(self):
+        """Block until queued deletes (not pending retries) are done."""
+        self._deletes.join()
@@ -0,0 +1,183 @@
+import threading
+import time
+from collections import OrderedDict
+
+import queries
+
+
+def _parse_version(value):
+    # "<generation> <unix time of the bump>"
+    parts = value.split()
+    return int(parts[0]), int(parts[1]) if len(parts) > 1 else 0
+
+
+def read_version(c, key):
+    c.execute(queries.SETTING_VALUE, (key,))
+    row = c.fetchone()
+    return _parse_version(row["value"]) if row else (0, 0)
+
+
+def bump_version(c, key):
+    # The counter lives in the settings table so every process sharing the
+    # database sees the bump without extra schema.
+    now = int(time.time())
+    c.execute(
+        "INSERT INTO settings (key, value) VALUES (%s, %s) ON CONFLICT (key) DO UPDATE SET value = (split_part(settings.value, ' ', 1)::bigint + 1)::text || ' ' || %s RETURNING value",
+        (key, f"1 {now}", str(now)),
+    )
+    return _parse_version(c.fetchone()["value"])
+
+
+class GenerationCache:
+    """Process-local copy of database-derived data, versioned by a counter.
+
+    ``load(cursor)`` builds the cached value. The shared counter, a
+    ``(generation, modified_at)`` version, is re-read at most every
+    ``check_interval`` seconds, so in steady state a request costs no queries
+    at all; a local ``invalidate()`` forces a check on the next access.
+    """
+
+    def __init__(self, key, load, check_interval=5.0):
+        self.key = key
+        self.load = load
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entry = None
+        self._generation = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.reloads = 0
+
+    def _fresh(self):
+        return (
+            self._generation is not None
+            and time.monotonic() - self._checked_at < self.check_interval
+        )
+
+    def get(self, get_conn):
+        """Return ``(version, value)``, reloading if the counter moved."""
+        if self._fresh():
+            self.hits += 1
+            return self._entry
+        with self._lock:
+            if self._fresh():
+                self.hits += 1
+                return self._entry
+            c = get_conn().cursor()
+            version = read_version(c, self.key)
+            if self._entry is None or version != self._entry[0]:
+                self._entry = (version, self.load(c))
+                self.reloads += 1
+            self._generation = version[0]
+            self._checked_at = time.monotonic()
+            return self._entry
+
+    def invalidate(self):
+        with self._lock:
+            self._generation = None
+
+
+class PageCache:
+    """Bounded LRU of rendered responses with a TTL and tag invalidation.
+
+    Entries are tagged with what they were rendered from (``products``,
+    ``product:42``...) so a local write only drops the pages it affects.
+    Writes made by other processes are picked up through a shared generation
+    counter, polled every ``check_interval`` seconds, which clears the cache.
+    """
+
+    def __init__(self, key, maxsize=512, ttl=300.0, check_interval=5.0):
+        self.key = key
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}  # tag -> set of keys
+        self._version = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def sync(self, get_conn):
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return
+            version = read_version(get_conn().cursor(), self.key)
+            if version != self._version:
+                self._clear()
+                self._version = version
+            self._checked_at = time.monotonic()
+
+    @property
+    def version(self):
+        """``(generation, modified_at)`` of the data the cached pages reflect."""
+        return self._version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, tags=(), version=None):
+        """Cache ``value``; ``version`` is ``self.version`` from before it was built.
+
+        If the cache was invalidated or cleared since then, ``value`` may have
+        been rendered from data the write replaced, so it is not stored.
+        """
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, version, *tags):
+        """Drop pages tagged with any of ``tags`` after a local write.
+
+        ``version`` is the counter value the write produced; if it skipped
+        past ours another process wrote too, so everything goes.
+        """
+        with self._lock:
+            if self._version is not None and version[0] == self._version[0] + 1:
+                for tag in tags:
+                    for key in list(self._tags.get(tag, ())):
+                        self._drop(key)
+            else:
+                self._clear()
+            self._version = version
+            # Re-read the counter on the next request: if it is served from a
+            # replica that has not replayed this write yet, the version goes
+            # back and pages rendered from the stale data are dropped again
+            # once it catches up.
+            self._checked_at = 0.0
+
+    def _drop(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _clear(self):
+        self._entries.clear()
+        self._tags.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,138 @@
+import csv
+import io
+import json
+from itertools import chain
+
+PRODUCT_COLUMNS = [
+    "id",
+    "category_id",
+    "title_en",
+    "title_zh",
+    "price",
+    "main_image",
+    "bullet_points_en",
+    "bullet_points_zh",
+    "description_en",
+    "description_zh",
+    "a_plus_images",
+    "monthly_sales",
+    "avg_rating",
+    "is_new",
+    "is_deal",
+    "is_featured",
+]
+ORDER_COLUMNS = ["id", "product_name", "customer_name", "contact_info", "note", "date"]
+
+_INT_COLUMNS = {"id", "category_id", "monthly_sales"}
+_FLAG_COLUMNS = {"is_new", "is_deal", "is_featured"}
+_FLOAT_COLUMNS = {"avg_rating"}
+_TRUE = {"1", "true", "yes", "on"}
+_FALSE = {"", "0", "false", "no", "off"}
+
+# Flush encoded export output in chunks of about this many characters.
+_CHUNK_SIZE = 64 * 1024
+
+
+class RowError(ValueError):
+    def __init__(self, line, message):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+
+
+def read_records(stream, filename):
+    """Yield ``(line, record)`` from a CSV or JSONL upload, one row at a time."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if filename.lower().endswith(".jsonl"):
+        for line, raw in enumerate(text, 1):
+            if not raw.strip():
+                continue
+            try:
+                record = json.loads(raw)
+            except ValueError as e:
+                raise RowError(line, f"invalid JSON ({e})") from None
+            if not isinstance(record, dict):
+                raise RowError(line, "expected a JSON object")
+            yield line, record
+    else:
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record
+
+
+def clean_product(line, record):
+    """Validate one imported product, converting its values to column types.
+
+    Only the product columns present in ``record`` are returned, so an
+    import can update some columns of existing products and leave the
+    rest alone. An empty numeric cell counts as absent: a new product gets
+    the column default and an existing one keeps its value. An empty
+    ``id`` means a new product.
+    """
+    product = {}
+    for column in PRODUCT_COLUMNS:
+        if column not in record:
+            continue
+        value = record[column]
+        text = "" if value is None else str(value).strip()
+        try:
+            if column in _INT_COLUMNS:
+                value = int(text) if text else None
+            elif column in _FLOAT_COLUMNS:
+                value = float(text) if text else None
+            elif column in _FLAG_COLUMNS:
+                if text.lower() not in _TRUE | _FALSE:
+                    raise ValueError(text)
+                value = 1 if text.lower() in _TRUE else 0
+            else:
+                value = text
+        except ValueError:
+            raise RowError(line, f"invalid {column} {text!r}") from None
+        if value is not None:
+            product[column] = value
+    if list(product) == ["id"]:
+        raise RowError(line, "no product columns to update")
+    if "id" not in product:
+        check_new_product(line, product)
+    return product
+
+
+def check_new_product(line, product):
+    """Raise RowError unless ``product`` has what a new product needs."""
+    for column in ("title_en", "price"):
+        if not product.get(column):
+            raise RowError(line, f"{column} is required for a new product")
+
+
+def _chunked(pieces):
+    buf, size = [], 0
+    for piece in pieces:
+        buf.append(piece)
+        size += len(piece)
+        if size >= _CHUNK_SIZE:
+            yield "".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf)
+
+
+def encode_csv(columns, rows):
+    """Stream ``rows`` (tuples) as CSV text chunks, header first."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+
+    def lines():
+        for values in chain([columns], rows):
+            writer.writerow(values)
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+
+    return _chunked(lines())
+
+
+def encode_jsonl(columns, rows):
+    """Stream ``rows`` (tuples) as JSON lines, one object per row."""
+    return _chunked(
+        json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + "\n"
+        for row in rows
+    )
@@ -0,0 +1,299 @@
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# Called as on_query(sql, seconds) after every statement run on a cursor of
+# a pooled connection, including failed ones.
+on_query = None
+
+
+class _TimedCursorMixin:
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            if on_query is not None:
+                on_query(query, time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            if on_query is not None:
+                on_query(query, time.perf_counter() - start)
+
+
+class TimedCursor(_TimedCursorMixin, psycopg2.extensions.cursor):
+    pass
+
+
+class TimedDictCursor(_TimedCursorMixin, psycopg2.extras.DictCursor):
+    pass
+
+
+def plain_cursor(conn):
+    """Cursor yielding bare tuples, for queries mapped onto compact row types."""
+    return conn.cursor(cursor_factory=TimedCursor)
+
+
+def server_cursor(conn, name, itersize=2000):
+    """Named cursor that keeps the result set on the server.
+
+    Iterating it fetches ``itersize`` rows at a time, so memory stays flat
+    however many rows the query returns. It lives until the transaction ends.
+    """
+    c = conn.cursor(name, cursor_factory=TimedCursor)
+    c.itersize = itersize
+    return c
+
+
+class ConnectionPool:
+    """Thread-safe Postgres connection pool shared by the waitress threads.
+
+    Connections are opened lazily up to ``maxconn``; callers beyond that wait
+    up to ``timeout`` seconds for one to be returned. Idle connections are
+    health-checked on checkout and the pool keeps at most ``minconn`` of them
+    once they have been idle longer than ``max_idle`` seconds.
+    """
+
+    def __init__(
+        self,
+        dsn,
+        minconn=1,
+        maxconn=10,
+        timeout=30.0,
+        max_idle=300.0,
+        check_after=30.0,
+    ):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self._cond = threading.Condition()
+        self._idle = []  # [(conn, returned_at)], LIFO so hot connections are reused
+        self._size = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._discarded = 0
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.cursor_factory = TimedDictCursor
+        return conn
+
+    def _healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if idle_for < self.check_after:
+            return True
+        try:
+            c = conn.cursor()
+            c.execute("SELECT 1")
+            c.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def open(self, count=None):
+        """Pre-open ``count`` connections, at least ``minconn``, at startup."""
+        count = min(max(count or 0, self.minconn), self.maxconn)
+        conns = []
+        try:
+            for _ in range(count):
+                conns.append(self.getconn())
+        finally:
+            for conn in conns:
+                self.putconn(conn)
+        return count
+
+    def getconn(self):
+        started = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    conn, returned_at = None, None
+                    break
+                now = time.monotonic()
+                if started is None:
+                    started = now
+                    self._waits += 1
+                remaining = self.timeout - (now - started)
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._wait_time += now - started
+                    raise PoolTimeout(
+                        f"no database connection available after {self.timeout}s"
+                    )
+                self._cond.wait(remaining)
+            if started is not None:
+                self._wait_time += time.monotonic() - started
+            self._in_use += 1
+            self._checkouts += 1
+
+        if conn is not None and not self._healthy(conn, time.monotonic() - returned_at):
+            self._close(conn)
+            with self._cond:
+                self._discarded += 1
+            conn = None
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._in_use -= 1
+                    self._cond.notify()
+                raise
+        return conn
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                if (
+                    conn.get_transaction_status()
+                    != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+                ):
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard or conn.closed:
+            self._close(conn)
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._discarded += 1
+                self._cond.notify()
+            return
+
+        now = time.monotonic()
+        stale = []
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((conn, now))
+            # Trim connections that have sat idle too long, oldest first.
+            while len(self._idle) > self.minconn and (
+                now - self._idle[0][1] > self.max_idle
+            ):
+                stale.append(self._idle.pop(0)[0])
+                self._size -= 1
+            self._cond.notify()
+        for old in stale:
+            self._close(old)
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "min": self.minconn,
+                "max": self.maxconn,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time_seconds": round(self._wait_time, 6),
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+            }
+
+
+class ReplicaSet:
+    """Connection pools for read replicas, used round-robin.
+
+    ``getconn()`` returns ``(pool, conn)`` from the next replica that is up,
+    or None when there is none, in which case the caller reads from the
+    primary instead. A replica that fails to connect is skipped for
+    ``retry_after`` seconds; the pools themselves health-check idle
+    connections on checkout.
+    """
+
+    def __init__(self, dsns, retry_after=30.0, **pool_kwargs):
+        self.pools = [ConnectionPool(dsn, **pool_kwargs) for dsn in dsns]
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._next = 0
+        self._down_until = [0.0] * len(self.pools)
+        self.failovers = 0
+
+    def __bool__(self):
+        return bool(self.pools)
+
+    def getconn(self):
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % max(len(self.pools), 1)
+        now = time.monotonic()
+        for i in range(len(self.pools)):
+            n = (start + i) % len(self.pools)
+            if self._down_until[n] > now:
+                continue
+            pool = self.pools[n]
+            try:
+                return pool, pool.getconn()
+            except psycopg2.OperationalError:
+                self._down_until[n] = time.monotonic() + self.retry_after
+            except PoolTimeout:
+                pass
+        if self.pools:
+            with self._lock:
+                self.failovers += 1
+        return None
+
+    def mark_down(self, pool):
+        """Skip ``pool`` for ``retry_after`` seconds, e.g. after a connection broke."""
+        n = self.pools.index(pool)
+        self._down_until[n] = time.monotonic() + self.retry_after
+        with self._lock:
+            self.failovers += 1
+
+    def open(self, count=None):
+        """Pre-open every replica's pool; one that refuses is marked down."""
+        for n, pool in enumerate(self.pools):
+            try:
+                pool.open(count)
+            except psycopg2.OperationalError:
+                self._down_until[n] = time.monotonic() + self.retry_after
+
+    def closeall(self):
+        for pool in self.pools:
+            pool.closeall()
+
+    def stats(self):
+        now = time.monotonic()
+        return [
+            dict(pool.stats(), up=int(self._down_until[n] <= now))
+            for n, pool in enumerate(self.pools)
+        ]
@@ -0,0 +1,78 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+
+def srcset_urls(srcsets):
+    """The image URLs listed in one or more newline-separated ``srcset`` values."""
+    return [part.split()[0] for part in re.split(r"[,\n]", srcsets or "") if part.strip()]
+
+
+class ImagePipeline:
+    """Builds resized WebP derivatives of uploaded images.
+
+    ``srcset(url)`` downloads the original from the blob store, uploads one
+    WebP per width narrower than the original and returns a ``srcset`` value
+    ending with the original itself. Jobs passed to ``submit`` run on a small
+    background pool so uploads never wait for image processing.
+    """
+
+    def __init__(self, store, widths=(320, 640, 1280), quality=80, max_workers=2):
+        self.store = store
+        self.widths = sorted(widths)
+        self.quality = quality
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def srcset(self, url):
+        with self.store.open(url) as f:
+            original = Image.open(f)
+            original.load()
+        original = ImageOps.exif_transpose(original)
+        # 调色板/灰度/RGB 图片的透明色记在 info["transparency"]，转换时保留为 alpha 通道
+        alpha = "A" in original.getbands() or "transparency" in original.info
+        if original.mode != ("RGBA" if alpha else "RGB"):
+            original = original.convert("RGBA" if alpha else "RGB")
+
+        stem = os.path.splitext(os.path.basename(urlparse(url).path))[0]
+        digest = hashlib.sha1(url.encode()).hexdigest()[:8]
+        candidates = []
+        for width in self.widths:
+            if width >= original.width:
+                break
+            height = round(original.height * width / original.width)
+            variant = original.resize((width, height), Image.LANCZOS)
+            buf = io.BytesIO()
+            variant.save(buf, "WEBP", quality=self.quality, method=6)
+            buf.seek(0)
+            variant_url = self.store.put(
+                f"uploads/variants/{stem}-{digest}_{width}w.webp", buf
+            )
+            candidates.append(f"{variant_url} {width}w")
+        candidates.append(f"{url} {original.width}w")
+        return ", ".join(candidates)
+
+    def submit(self, fn, *args):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="image"
+                )
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future):
+        if future.exception() is not None:
+            logger.error("Image derivative job failed", exc_info=future.exception())
@@ -0,0 +1,135 @@
+import os
+import re
+
+import queries
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+LOCK_KEY = 730419  # pg_advisory_lock id, keeps concurrent deploys from racing
+
+# The queries the hot pages depend on, built by the same functions the views
+# use, with representative parameters. check_query_plans() fails if any of
+# them can only be answered by a sequential scan, i.e. if the index backing
+# it is missing or unusable.
+HOT_QUERIES = [
+    (
+        "index featured",
+        queries.product_cards("en", "is_featured = 1", limit=True),
+        (6,),
+    ),
+    (
+        "deals page",
+        queries.product_cards("en", "is_deal = 1 AND id < %s", limit=True),
+        (1000000, 25),
+    ),
+    (
+        "new arrivals page",
+        queries.product_cards("en", "is_new = 1 AND id < %s", limit=True),
+        (1000000, 25),
+    ),
+    (
+        "category page",
+        queries.product_cards("en", "category_id = %s AND id < %s", limit=True),
+        (1, 1000000, 25),
+    ),
+    ("category by slug", queries.CATEGORY_BY_SLUG, ("slug",)),
+    ("product detail", queries.product_detail("en"), (1,)),
+    (
+        "product reviews",
+        queries.review_page("en", "product_id = %s AND id < %s"),
+        (1, 1000000, 7),
+    ),
+    ("product search", queries.product_search("en"), ("dog:*", "狗窝", 25, 0)),
+    ("settings row", queries.SETTING_VALUE, ("key",)),
+    (
+        "admin orders by date",
+        queries.keyset_page(
+            queries.ADMIN_ORDERS, ["(date, id) < (%s, %s)"], "date", "DESC"
+        ),
+        ("9999-12-31", 1000000, 51),
+    ),
+    (
+        "admin products by sales",
+        queries.keyset_page(
+            queries.ADMIN_PRODUCTS,
+            ["(p.monthly_sales, p.id) < (%s, %s)"],
+            "p.monthly_sales",
+            "DESC",
+            id_column="p.id",
+        ),
+        (1000000, 1000000, 51),
+    ),
+]
+
+
+def available():
+    """``[(version, filename)]`` of the migration files, in order."""
+    names = sorted(
+        name
+        for name in os.listdir(MIGRATIONS_DIR)
+        if re.match(r"^\d{4}_\w+\.sql$", name)
+    )
+    return [(name[:4], name) for name in names]
+
+
+def applied(c):
+    c.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations (version TEXT PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+    )
+    c.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in c.fetchall()}
+
+
+def upgrade(conn, log=print):
+    """Apply pending migrations, each in its own transaction."""
+    c = conn.cursor()
+    c.execute("SELECT pg_advisory_lock(%s)", (LOCK_KEY,))
+    try:
+        done = applied(c)
+        conn.commit()
+        for version, name in available():
+            if version in done:
+                continue
+            with open(os.path.join(MIGRATIONS_DIR, name), encoding="utf-8") as f:
+                c.execute(f.read())
+            c.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name),
+            )
+            conn.commit()
+            log(f"Applied {name}")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        c.execute("SELECT pg_advisory_unlock(%s)", (LOCK_KEY,))
+        conn.commit()
+
+
+def _seq_scans(plan):
+    found = []
+    if plan["Node Type"] == "Seq Scan":
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", ()):
+        found.extend(_seq_scans(child))
+    return found
+
+
+def check_query_plans(conn):
+    """Return ``[(name, tables)]`` for hot queries that plan a sequential scan.
+
+    Sequential scans are disabled for the session so that on a small table the
+    planner still picks an index when one exists; a Seq Scan in the plan then
+    means no index can serve the query.
+    """
+    c = conn.cursor()
+    failures = []
+    try:
+        c.execute("SET LOCAL enable_seqscan = off")
+        for name, sql, params in HOT_QUERIES:
+            c.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            tables = _seq_scans(c.fetchone()[0][0]["Plan"])
+            if tables:
+                failures.append((name, tables))
+    finally:
+        conn.rollback()
+    return failures
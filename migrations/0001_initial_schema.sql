@@ -0,0 +1,53 @@
+-- Tables as the app has always used them; IF NOT EXISTS lets existing
+-- databases adopt the migration history without changes.
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+
+CREATE TABLE IF NOT EXISTS categories (
+    id SERIAL PRIMARY KEY,
+    name_en TEXT,
+    name_zh TEXT,
+    slug TEXT UNIQUE,
+    image TEXT,
+    sort_order INTEGER DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS products (
+    id SERIAL PRIMARY KEY,
+    category_id INTEGER,
+    title_en TEXT,
+    title_zh TEXT,
+    price TEXT,
+    main_image TEXT,
+    bullet_points_en TEXT,
+    bullet_points_zh TEXT,
+    description_en TEXT,
+    description_zh TEXT,
+    a_plus_images TEXT,
+    is_new INTEGER DEFAULT 0,
+    is_deal INTEGER DEFAULT 0,
+    is_featured INTEGER DEFAULT 0,
+    monthly_sales INTEGER DEFAULT 0,
+    avg_rating REAL DEFAULT 5.0
+);
+
+CREATE TABLE IF NOT EXISTS feedback (
+    id SERIAL PRIMARY KEY,
+    product_id INTEGER,
+    rating REAL,
+    text_en TEXT,
+    text_zh TEXT,
+    image TEXT,
+    category_id INTEGER DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS orders (
+    id SERIAL PRIMARY KEY,
+    product_name TEXT,
+    customer_name TEXT,
+    contact_info TEXT,
+    note TEXT,
+    date TEXT
+);
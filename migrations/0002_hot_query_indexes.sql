@@ -0,0 +1,16 @@
+-- One index per public listing query in app.py, each matching its
+-- WHERE clause and its ORDER BY id DESC keyset pagination.
+CREATE INDEX IF NOT EXISTS products_category_id_idx
+    ON products (category_id, id DESC);
+
+CREATE INDEX IF NOT EXISTS products_featured_idx
+    ON products (id DESC) WHERE is_featured = 1;
+
+CREATE INDEX IF NOT EXISTS products_deal_idx
+    ON products (id DESC) WHERE is_deal = 1;
+
+CREATE INDEX IF NOT EXISTS products_new_idx
+    ON products (id DESC) WHERE is_new = 1;
+
+CREATE INDEX IF NOT EXISTS feedback_product_id_idx
+    ON feedback (product_id, id DESC);
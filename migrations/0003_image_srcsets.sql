@@ -0,0 +1,6 @@
+-- srcset values for the resized WebP derivatives of uploaded images.
+-- a_plus_images_srcset holds one srcset per line, in a_plus_images order.
+ALTER TABLE products ADD COLUMN IF NOT EXISTS main_image_srcset TEXT DEFAULT '';
+ALTER TABLE products ADD COLUMN IF NOT EXISTS a_plus_images_srcset TEXT DEFAULT '';
+ALTER TABLE categories ADD COLUMN IF NOT EXISTS image_srcset TEXT DEFAULT '';
+ALTER TABLE feedback ADD COLUMN IF NOT EXISTS image_srcset TEXT DEFAULT '';
@@ -0,0 +1,38 @@
+-- Running review totals per product, kept up to date by ADD_FEEDBACK in the
+-- same transaction as the insert. The average rating is
+-- review_rating_sum / review_count; review_stars_N counts ratings that
+-- round to N stars.
+ALTER TABLE products ADD COLUMN IF NOT EXISTS review_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS review_rating_sum REAL NOT NULL DEFAULT 0;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS review_stars_1 INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS review_stars_2 INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS review_stars_3 INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS review_stars_4 INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS review_stars_5 INTEGER NOT NULL DEFAULT 0;
+
+UPDATE products p SET
+    review_count = s.n,
+    review_rating_sum = s.total,
+    review_stars_1 = s.stars_1,
+    review_stars_2 = s.stars_2,
+    review_stars_3 = s.stars_3,
+    review_stars_4 = s.stars_4,
+    review_stars_5 = s.stars_5
+FROM (
+    SELECT
+        product_id,
+        count(*) AS n,
+        sum(rating) AS total,
+        count(*) FILTER (WHERE stars <= 1) AS stars_1,
+        count(*) FILTER (WHERE stars = 2) AS stars_2,
+        count(*) FILTER (WHERE stars = 3) AS stars_3,
+        count(*) FILTER (WHERE stars = 4) AS stars_4,
+        count(*) FILTER (WHERE stars >= 5) AS stars_5
+    FROM (
+        SELECT product_id, rating, floor(rating + 0.5) AS stars
+        FROM feedback
+        WHERE rating IS NOT NULL
+    ) f
+    GROUP BY product_id
+) s
+WHERE p.id = s.product_id;
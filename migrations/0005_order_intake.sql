@@ -0,0 +1,4 @@
+-- Orders reach the table from the local order journal, which may replay a
+-- batch after a crash; intake_id makes those inserts idempotent.
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS intake_id TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS orders_intake_id_idx ON orders (intake_id);
@@ -0,0 +1,31 @@
+-- Full-text search over the product text in both languages.
+--
+-- English goes through the english text search configuration. Chinese has
+-- no word boundaries, so every CJK character and every pair of adjacent
+-- CJK characters becomes a lexeme; a query matches when all of its bigrams
+-- are present. Titles rank above bullet points, which rank above
+-- descriptions.
+CREATE OR REPLACE FUNCTION cjk_grams(body text) RETURNS text
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+    SELECT coalesce(string_agg(substr(run[1], i, n), ' '), '')
+    FROM regexp_matches(body, '[\u3400-\u4dbf\u4e00-\u9fff]+', 'g') AS run,
+        generate_series(1, 2) AS n,
+        generate_series(1, length(run[1]) - n + 1) AS i
+$$;
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS search_en tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title_en, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(bullet_points_en, '')), 'B')
+        || setweight(to_tsvector('english', coalesce(description_en, '')), 'C')
+    ) STORED;
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS search_zh tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', cjk_grams(coalesce(title_zh, ''))), 'A')
+        || setweight(to_tsvector('simple', cjk_grams(coalesce(bullet_points_zh, ''))), 'B')
+        || setweight(to_tsvector('simple', cjk_grams(coalesce(description_zh, ''))), 'C')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS products_search_en_idx ON products USING GIN (search_en);
+CREATE INDEX IF NOT EXISTS products_search_zh_idx ON products USING GIN (search_zh);
@@ -0,0 +1,5 @@
+-- Keyset pages of the admin orders and products tables, one index per
+-- sort order they offer besides id.
+CREATE INDEX IF NOT EXISTS orders_date_idx ON orders (date, id);
+
+CREATE INDEX IF NOT EXISTS products_monthly_sales_idx ON products (monthly_sales, id);
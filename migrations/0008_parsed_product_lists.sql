@@ -0,0 +1,23 @@
+-- Bullet points and A+ images as arrays, parsed once when a product is
+-- written instead of on every page view. Bullets are the non-blank lines
+-- of bullet_points_*, trimmed; the A+ arrays split a_plus_images on commas
+-- and a_plus_images_srcset on newlines, so entries pair up by position.
+ALTER TABLE products ADD COLUMN IF NOT EXISTS bullets_en TEXT[]
+    GENERATED ALWAYS AS (
+        array_remove(regexp_split_to_array(regexp_replace(coalesce(bullet_points_en, ''), '^\s+|\s+$', '', 'g'), '\s*\n\s*'), '')
+    ) STORED;
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS bullets_zh TEXT[]
+    GENERATED ALWAYS AS (
+        array_remove(regexp_split_to_array(regexp_replace(coalesce(bullet_points_zh, ''), '^\s+|\s+$', '', 'g'), '\s*\n\s*'), '')
+    ) STORED;
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS a_plus_image_list TEXT[]
+    GENERATED ALWAYS AS (
+        coalesce(string_to_array(nullif(a_plus_images, ''), ','), '{}')
+    ) STORED;
+
+ALTER TABLE products ADD COLUMN IF NOT EXISTS a_plus_srcset_list TEXT[]
+    GENERATED ALWAYS AS (
+        coalesce(string_to_array(nullif(a_plus_images_srcset, ''), E'\n'), '{}')
+    ) STORED;
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class OrderJournal:
+    """Write-behind intake: orders are made durable locally, then batched.
+
+    ``append`` writes a record to the current append-only segment file and
+    returns once it is fsynced; appends that arrive while an fsync is running
+    share the next one. A background writer rotates the segment every
+    ``flush_interval`` seconds, or as soon as it holds ``batch_size`` records,
+    hands the records to ``write_batch`` and deletes the segment once that
+    succeeds. Segments left behind by a crash are written the same way on
+    start, so ``write_batch`` must be idempotent.
+    """
+
+    def __init__(
+        self,
+        directory,
+        write_batch,
+        batch_size=500,
+        flush_interval=1.0,
+        retry_delay=5.0,
+    ):
+        self.directory = directory
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self._cond = threading.Condition()
+        self._file = None
+        self._seq = 0
+        self._count = 0  # records in the current segment
+        self._written = 0
+        self._synced = 0
+        self._sync_failure = None  # (last record it covered, exception)
+        self._started = False
+
+    def start(self):
+        with self._cond:
+            if self._started:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            segments = self._segments()
+            self._seq = segments[-1] if segments else 0
+            self._open_segment()
+            for target, name in (
+                (self._sync_loop, "order-fsync"),
+                (self._drain_loop, "order-writer"),
+            ):
+                threading.Thread(target=target, name=name, daemon=True).start()
+            self._started = True
+
+    def append(self, record):
+        """Journal ``record`` (a JSON-serialisable dict); blocks until durable."""
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        self.start()
+        with self._cond:
+            self._file.write(line)
+            self._count += 1
+            self._written += 1
+            seq = self._written
+            self._cond.notify_all()
+            while True:
+                failure = self._sync_failure
+                if failure is not None and failure[0] >= seq:
+                    raise OSError("order journal fsync failed") from failure[1]
+                if self._synced >= seq:
+                    return
+                self._cond.wait()
+
+    def _path(self, seq):
+        return os.path.join(self.directory, f"{seq:012d}.jsonl")
+
+    def _segments(self):
+        return sorted(
+            int(name[:-6])
+            for name in os.listdir(self.directory)
+            if name.endswith(".jsonl") and name[:-6].isdigit()
+        )
+
+    def _open_segment(self):
+        self._seq += 1
+        self._file = open(self._path(self._seq), "ab")
+        self._count = 0
+
+    def _sync_loop(self):
+        while True:
+            with self._cond:
+                while self._synced == self._written:
+                    self._cond.wait()
+                target = self._written
+                self._file.flush()
+                # A duplicate descriptor stays valid if the segment rotates
+                # while we are syncing outside the lock.
+                fd = os.dup(self._file.fileno())
+            try:
+                os.fsync(fd)
+                failure = None
+            except OSError as e:
+                logger.error("Order journal fsync failed: %s", e)
+                failure = (target, e)
+            finally:
+                os.close(fd)
+            with self._cond:
+                self._synced = max(self._synced, target)
+                if failure is not None:
+                    self._sync_failure = failure
+                self._cond.notify_all()
+
+    def _rotate(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._synced = self._written
+        self._cond.notify_all()
+        self._open_segment()
+
+    def _drain_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._count >= self.batch_size, self.flush_interval
+                )
+                if self._count:
+                    self._rotate()
+                current = self._seq
+            for seq in self._segments():
+                if seq >= current:
+                    break
+                try:
+                    self._write_segment(seq)
+                except Exception as e:
+                    logger.warning(
+                        "Writing order journal segment %s failed: %s", seq, e
+                    )
+                    time.sleep(self.retry_delay)
+                    break
+
+    def replay(self, directory):
+        """Write and delete the segments an abandoned journal left in ``directory``.
+
+        Raises, keeping the unwritten segments, if ``write_batch`` fails.
+        """
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".jsonl") and name[:-6].isdigit():
+                self._write_file(os.path.join(directory, name))
+
+    def _write_segment(self, seq):
+        self._write_file(self._path(seq))
+
+    def _write_file(self, path):
+        with open(path, "rb") as f:
+            # A line without its newline is a torn write from a crash; it was
+            # never acknowledged, so it is dropped.
+            records = [json.loads(line) for line in f if line.endswith(b"\n")]
+        for i in range(0, len(records), self.batch_size):
+            self.write_batch(records[i : i + self.batch_size])
+        os.remove(path)
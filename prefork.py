@@ -0,0 +1,253 @@
+import itertools
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import time
+
+from waitress.channel import HTTPChannel
+from waitress.server import create_server
+from waitress.task import WSGITask
+
+logger = logging.getLogger(__name__)
+
+# 刚启动就退出的 worker 隔这么久再重启，避免启动失败时反复 fork
+RESPAWN_DELAY = 1.0
+# 排空时，空闲了这么久的 keep-alive 连接直接关闭
+DRAIN_IDLE = 1.0
+
+
+class DrainingTask(WSGITask):
+    def build_response_header(self):
+        # 排空期间的响应都带 Connection: close，客户端的下一个请求会走新连接，
+        # 由别的 worker 接收
+        if self.channel.server.draining:
+            self.set_close_on_finish()
+        return super().build_response_header()
+
+
+class DrainingChannel(HTTPChannel):
+    task_class = DrainingTask
+
+
+class Worker:
+    def __init__(self, pid, slot, ready_fd):
+        self.pid = pid
+        self.slot = slot
+        self.ready_fd = ready_fd  # 子进程就绪时写入一个字节
+        self.started_at = time.monotonic()
+        self.ready = False
+        self.retiring = False
+
+
+class PreforkServer:
+    """A master process forking ``workers`` waitress processes on one socket.
+
+    The master binds the listening socket and never imports the
+    application: each worker calls ``load_app(slot)`` after the fork, so
+    connection pools, caches and background threads all belong to a single
+    worker, and a new worker always runs the code currently on disk. Slots
+    are numbered ``0..workers-1`` and a replacement reuses the slot of the
+    worker it replaces, so per-slot resources (the order journal) are never
+    shared by two live processes. A worker tells the master it is ready once
+    ``load_app`` returns.
+
+    A worker drains and exits after ``max_requests`` requests (plus a random
+    ``0..max_requests_jitter`` so they do not all recycle at once) and the
+    master starts a fresh one in its slot. SIGHUP replaces the workers one at
+    a time, stopping the next only once the previous replacement is ready;
+    SIGTERM and SIGINT drain every worker and exit. Draining stops accepting,
+    answers with ``Connection: close``, closes idle keep-alive connections
+    and waits up to ``graceful_timeout`` seconds for requests in flight.
+    """
+
+    def __init__(
+        self,
+        load_app,
+        host,
+        port,
+        workers,
+        threads=4,
+        max_requests=0,
+        max_requests_jitter=0,
+        graceful_timeout=30.0,
+        **serve_kwargs,
+    ):
+        self.load_app = load_app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.serve_kwargs = serve_kwargs
+        self.socket = None
+        self._workers = {}  # pid -> Worker
+        self._replace = []  # slots still to be replaced by a reload
+        self._stopping = False
+
+    # --- master ---
+
+    def run(self):
+        self.socket = socket.create_server(
+            (self.host, self.port), backlog=self.serve_kwargs.get("backlog", 1024)
+        )
+        signal.signal(signal.SIGHUP, lambda *_: self.reload())
+        signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        signal.signal(signal.SIGINT, lambda *_: self.stop())
+        logger.info(
+            "Serving on http://%s:%s with %d workers x %d threads",
+            self.host,
+            self.port,
+            self.workers,
+            self.threads,
+        )
+        for slot in range(self.workers):
+            self._spawn(slot)
+        while not self._stopping:
+            self._wait_ready(1.0)
+            self._reap()
+            self._roll()
+        self._shutdown()
+
+    def reload(self):
+        logger.info("Reloading workers")
+        self._replace = list(range(self.workers))
+
+    def stop(self):
+        self._stopping = True
+
+    def _spawn(self, slot):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            for worker in self._workers.values():
+                os.close(worker.ready_fd)
+            code = 1
+            try:
+                code = self._serve(slot, write_fd)
+            except BaseException:
+                logger.exception("Worker %d failed", slot)
+            finally:
+                logging.shutdown()
+                os._exit(code)
+        os.close(write_fd)
+        self._workers[pid] = Worker(pid, slot, read_fd)
+
+    def _wait_ready(self, timeout):
+        pending = {w.ready_fd: w for w in self._workers.values() if not w.ready}
+        if not pending:
+            time.sleep(timeout)
+            return
+        readable, _, _ = select.select(list(pending), [], [], timeout)
+        for fd in readable:
+            worker = pending[fd]
+            # 读到数据表示就绪；读到 EOF 表示进程在就绪前退出，由 _reap 处理
+            if os.read(fd, 1):
+                worker.ready = True
+                logger.info("Worker %d (pid %d) ready", worker.slot, worker.pid)
+
+    def _reap(self):
+        while self._workers:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            worker = self._workers.pop(pid, None)
+            if worker is None:
+                continue
+            os.close(worker.ready_fd)
+            code = os.waitstatus_to_exitcode(status)
+            if code != 0 and not worker.retiring:
+                logger.warning(
+                    "Worker %d (pid %d) exited with %d", worker.slot, pid, code
+                )
+            if self._stopping:
+                continue
+            if time.monotonic() - worker.started_at < RESPAWN_DELAY:
+                time.sleep(RESPAWN_DELAY)
+            self._spawn(worker.slot)
+
+    def _roll(self):
+        # 一次只换一个 worker，新进程就绪后才停下一个，其余 worker 持续服务
+        if not self._replace or len(self._workers) < self.workers:
+            return
+        # 被换下的 worker 退出、被 _reap 收回之前仍在 _workers 里，也要等它
+        if not all(w.ready and not w.retiring for w in self._workers.values()):
+            return
+        slot = self._replace.pop(0)
+        for worker in self._workers.values():
+            if worker.slot == slot:
+                worker.retiring = True
+                os.kill(worker.pid, signal.SIGTERM)
+
+    def _shutdown(self):
+        logger.info("Stopping %d workers", len(self._workers))
+        for worker in self._workers.values():
+            os.kill(worker.pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self._workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for worker in self._workers.values():
+            os.kill(worker.pid, signal.SIGKILL)
+        while self._workers:
+            self._reap()
+            time.sleep(0.1)
+        self.socket.close()
+
+    # --- worker ---
+
+    def _serve(self, slot, ready_fd):
+        # 只有 master 处理 Ctrl-C 和 SIGHUP；worker 收到 SIGTERM 后排空退出
+        stopping = []
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+
+        app = self.load_app(slot)
+        limit = self.max_requests
+        if limit:
+            limit += random.randint(0, self.max_requests_jitter)
+        handled = itertools.count(1)
+
+        def counted_app(environ, start_response):
+            if limit and next(handled) >= limit and not stopping:
+                stopping.append(True)
+            return app(environ, start_response)
+
+        server = create_server(
+            counted_app,
+            sockets=[self.socket],
+            threads=self.threads,
+            **self.serve_kwargs,
+        )
+        server.channel_class = DrainingChannel
+        server.draining = False
+        os.write(ready_fd, b"1")
+        os.close(ready_fd)
+
+        deadline = None
+        while True:
+            if stopping and deadline is None:
+                server.accepting = False
+                server.draining = True
+                deadline = time.monotonic() + self.graceful_timeout
+            if deadline is not None:
+                idle_since = time.time() - DRAIN_IDLE
+                for channel in list(server.active_channels.values()):
+                    if not channel.requests and channel.last_activity < idle_since:
+                        channel.close_when_flushed = True
+                if not server.active_channels or time.monotonic() >= deadline:
+                    break
+            server.asyncore.loop(
+                timeout=1.0 if deadline is None else 0.1,
+                map=server._map,
+                use_poll=server.adj.asyncore_use_poll,
+                count=1,
+            )
+        server.task_dispatcher.shutdown()
+        return 0
@@ -0,0 +1,46 @@
+# 热点读查询的 SQL：视图执行它们，migrate.HOT_QUERIES 用同一份 SQL 检查执行计划，
+# 两边不会各改各的
+
+# 列表页只取卡片用到的列（当前语言）
+CARD_COLUMNS = {
+    "en": "id, title_en, price, main_image, main_image_srcset",
+    "zh": "id, title_zh, price, main_image, main_image_srcset",
+}
+REVIEW_COLUMNS = {
+    "en": "id, rating, text_en, image, image_srcset",
+    "zh": "id, rating, text_zh, image, image_srcset",
+}
+
+CATEGORY_BY_SLUG = "SELECT * FROM categories WHERE slug = %s"
+SETTING_VALUE = "SELECT value FROM settings WHERE key = %s"
+
+ADMIN_ORDERS = (
+    "SELECT id, product_name, customer_name, contact_info, note, date FROM orders"
+)
+ADMIN_ORDER_SORTS = {"id": "id", "date": "date"}
+ADMIN_PRODUCTS = "SELECT p.id, p.title_en, p.title_zh, p.price, p.main_image, p.monthly_sales AS sales, c.name_zh AS category_name_zh FROM products p LEFT JOIN categories c ON p.category_id = c.id"
+ADMIN_PRODUCT_SORTS = {"id": "p.id", "sales": "p.monthly_sales"}
+
+
+def product_cards(lang, where, limit=False):
+    """Product cards matching ``where``, newest first; ``limit`` adds ``LIMIT %s``."""
+    sql = f"SELECT {CARD_COLUMNS[lang]} FROM products WHERE {where} ORDER BY id DESC"
+    return sql + " LIMIT %s" if limit else sql
+
+
+def product_search(lang):
+    """Cards ranked by the English and Chinese tsqueries, then LIMIT/OFFSET."""
+    return f"SELECT {CARD_COLUMNS[lang]} FROM products, to_tsquery('english', %s) en, to_tsquery('simple', %s) zh WHERE search_en @@ en OR search_zh @@ zh ORDER BY coalesce(ts_rank(search_en, en), 0) + coalesce(ts_rank(search_zh, zh), 0) DESC, id DESC LIMIT %s OFFSET %s"
+
+
+def product_detail(lang):
+    return f"SELECT id, title_en, title_zh, price, main_image, main_image_srcset, description_{lang}, bullets_{lang}, a_plus_image_list, a_plus_srcset_list, avg_rating, review_count, review_rating_sum, review_stars_1, review_stars_2, review_stars_3, review_stars_4, review_stars_5 FROM products WHERE id = %s"
+
+
+def review_page(lang, where):
+    return f"SELECT {REVIEW_COLUMNS[lang]} FROM feedback WHERE {where} ORDER BY id DESC LIMIT %s"
+
+
+def keyset_page(select, where, column, order, id_column="id"):
+    """``select`` filtered by the ``where`` list, sorted by ``column`` then id."""
+    return f"{select} WHERE {' AND '.join(where) or 'TRUE'} ORDER BY {column} {order}, {id_column} {order} LIMIT %s"
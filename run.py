@@ -1,9 +1,133 @@
 # run.py
-from waitress import serve
-from app import app
-    
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HOST = os.environ.get('HOST', '0.0.0.0')
+PORT = int(os.environ.get('PORT', 5000))
+THREADS = int(os.environ.get('WAITRESS_THREADS', 4))
+# worker 进程数；默认 1，即单进程运行
+WORKERS = int(os.environ.get('WEB_WORKERS', 1))
+# 数据库连接预算是整个服务的总数，多进程时平分给各 worker
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+# 内部监控端口（/metrics、/stats/db）：worker N 监听 METRICS_PORT + N。
+# 多进程时默认 9400，单进程时只在设置了 METRICS_PORT 时开启
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 9400 if WORKERS > 1 else 0))
+ORDER_JOURNAL_DIR = os.environ.get('ORDER_JOURNAL_DIR', 'order_journal')
+# 与 app 的上传上限（普通上传和批量导入中较大的一个）相同；多进程时 master 不导入 app
+MAX_REQUEST_BODY_SIZE = max(int(os.environ.get('MAX_UPLOAD_MB', 64)), int(os.environ.get('IMPORT_MAX_UPLOAD_MB', 1024))) * 1024 * 1024
+
+
+def retry(step, what):
+    # 数据库可能比应用晚就绪：失败就重试，在此之前 /readyz 一直返回 503
+    while True:
+        try:
+            return step()
+        except Exception:
+            logging.exception('%s failed, retrying in 5s', what)
+            time.sleep(5)
+
+
+def orphaned_journals():
+    # 调小 WEB_WORKERS 后，已不存在的 worker 留下的订单日志目录
+    if not os.path.isdir(ORDER_JOURNAL_DIR):
+        return []
+    paths = []
+    for name in sorted(os.listdir(ORDER_JOURNAL_DIR)):
+        slot = name[len('worker-'):]
+        if name.startswith('worker-') and slot.isdigit() and int(slot) >= WORKERS:
+            paths.append(os.path.join(ORDER_JOURNAL_DIR, name))
+    return paths
+
+
+def replay_orphaned_journals(order_journal):
+    for path in orphaned_journals():
+        order_journal.replay(path)
+        logging.info('Wrote the orders left in %s', path)
+        try:
+            os.rmdir(path)
+        except OSError:
+            pass
+
+
+def serve_metrics(slot):
+    import threading
+
+    from waitress import create_server
+    from app import internal_app
+
+    server = create_server(internal_app, host=METRICS_HOST, port=METRICS_PORT + slot, threads=1)
+    threading.Thread(target=server.run, name='metrics', daemon=True).start()
+
+
+def start_worker_app():
+    # 0 号 worker（单进程时即唯一进程）负责写入已不存在的 worker 留下的订单
+    from app import order_journal, warm_up
+
+    order_journal.start()
+    if order_journal.directory == ORDER_JOURNAL_DIR:
+        retry(lambda: replay_orphaned_journals(order_journal), 'Replaying order journals')
+    retry(lambda: warm_up(connections=THREADS), 'Warm-up')
+
+
+def load_worker_app(slot):
+    # 在 fork 之后才导入 app：连接池、缓存和后台线程都属于这个 worker。
+    # 订单日志每个 worker 一个目录，0 号沿用原目录；替换的 worker 接手同一目录
+    if slot:
+        os.environ['ORDER_JOURNAL_DIR'] = os.path.join(ORDER_JOURNAL_DIR, f'worker-{slot}')
+    pool_max = max(1, DB_POOL_MAX // WORKERS)
+    os.environ['DB_POOL_MAX'] = str(pool_max)
+    os.environ['DB_POOL_MIN'] = str(min(DB_POOL_MIN, pool_max))
+    from app import app
+
+    app.config['PUBLIC_METRICS'] = False
+    serve_metrics(slot)
+    # 预热完成后才开始接受连接
+    start_worker_app()
+    return app
+
+
+def serve_single_process():
+    import threading
+
+    from waitress import serve
+    from app import app
+
+    if METRICS_PORT:
+        serve_metrics(0)
+    # 重放未写入数据库的订单和预热（编译模板、打开连接、渲染热门页面）在后台进行，
+    # /healthz 立即可用
+    threading.Thread(target=start_worker_app, name='warm-up', daemon=True).start()
+    # waitress 是生产级服务器
+    serve(app, host=HOST, port=PORT, threads=THREADS, max_request_body_size=MAX_REQUEST_BODY_SIZE)
+
+
 # 生产环境，关闭 Debug 模式
 if __name__ == '__main__':
     print("PeacePet CMS 生产环境启动中...")
-    # waitress 是生产级服务器
-    serve(app, host='0.0.0.0', port=5000)
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(levelname)s %(name)s: %(message)s')
+    if WORKERS > 1 and DB_POOL_MAX // WORKERS < THREADS:
+        logging.warning('DB_POOL_MAX=%d gives each of %d workers fewer connections than its %d threads', DB_POOL_MAX, WORKERS, THREADS)
+    if WORKERS <= 1 or not hasattr(os, 'fork'):
+        serve_single_process()
+    else:
+        from prefork import PreforkServer
+
+        # 多进程：每个 worker 各自一个 GIL，模板渲染可以用满所有核
+        PreforkServer(
+            load_worker_app,
+            HOST,
+            PORT,
+            workers=WORKERS,
+            threads=THREADS,
+            max_requests=int(os.environ.get('WORKER_MAX_REQUESTS', 0)),
+            max_requests_jitter=int(os.environ.get('WORKER_MAX_REQUESTS_JITTER', 0)),
+            graceful_timeout=float(os.environ.get('WORKER_GRACEFUL_TIMEOUT', 30)),
+            max_request_body_size=MAX_REQUEST_BODY_SIZE,
+        ).run()
\ No newline at end of file
@@ -0,0 +1,220 @@
+import html
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from urllib.parse import unquote, urlsplit
+
+from assets import atomic_write
+
+try:
+    import fcntl
+except ImportError:  # 没有 fcntl（Windows）时只在进程内互斥
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = ".snapshot.json"
+LOCK_FILE = ".snapshot.lock"
+# 静态站点没有按 Accept-Language 的跳转：根目录的 index.html 在浏览器里选语言
+ROOT_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8">
+<meta http-equiv="refresh" content="0; url=/{default}/">
+<script>
+var languages = {languages};
+var preferred = (navigator.languages || [navigator.language]).map(function (l) {{
+  return l.slice(0, 2).toLowerCase();
+}}).filter(function (l) {{ return languages.indexOf(l) >= 0; }})[0];
+location.replace("/" + (preferred || languages[0]) + "/");
+</script>
+</head><body><a href="/{default}/">{default}</a></body></html>
+"""
+# "更多" 链接和评价懒加载的下一页：href/data-next 属性或 JSON 的 next_url
+NEXT_LINK = re.compile(r'(?:href|data-next)="([^"]*[?&](?:amp;)?after=[^"]*)"')
+
+
+def static_path(url):
+    """The file a page URL is written to, and the link that serves it.
+
+    ``/en/product/5`` becomes ``en/product/5/index.html``; a query string
+    becomes one more path segment, so ``/en/deals?after=40`` is
+    ``en/deals/after-40/``.
+    JSON pages are written next to it as ``.json`` files. The file name is
+    the decoded path (``en/catalog/猫/``), which is what a static server
+    looks up for the percent-encoded link.
+    """
+    parts = urlsplit(url)
+    base = parts.path.strip("/")
+    if parts.query:
+        query = re.sub(r"[^\w.-]+", "-", parts.query.replace("format=json", ""))
+        base = "/".join(filter(None, [base, query.strip("-")]))
+    if "format=json" in parts.query:
+        return unquote(f"{base}.json"), f"/{base}.json"
+    name = "/".join(filter(None, [base, "index.html"]))
+    return unquote(name), f"/{base}/" if base else "/"
+
+
+class StaticSnapshot:
+    """Renders the public storefront into a directory of static files.
+
+    ``pages()`` lists ``(path, tags)`` for every public page, without the
+    language prefix, with the same tags the page cache uses (``products``,
+    ``product:42``). Each page is fetched through the app's test client as
+    ``/<lang><path>`` for every language, together with the "more" pages it
+    links to, whose links are rewritten to the static paths.
+    ``export(tags)`` re-renders only the pages carrying one of ``tags`` plus
+    pages that are new, and deletes pages that are gone; ``export()``
+    renders everything. Exports hold a lock file in the directory, so
+    several worker processes sharing it never interleave their updates.
+    """
+
+    def __init__(self, app, directory, pages, languages=("en", "zh"), delay=2.0):
+        self.app = app
+        self.directory = directory
+        self.pages = pages
+        self.languages = languages
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._pending = None  # set of tags, or "all"
+        self._thread = None
+
+    def submit(self, tags=None):
+        """Queue a background ``export(tags)``; bursts of writes coalesce."""
+        with self._cond:
+            if tags is None or self._pending == "all":
+                self._pending = "all"
+            else:
+                self._pending = (self._pending or set()) | set(tags)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="static-snapshot", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending is not None)
+            # 等一小会儿，让连续几次后台保存合并成一次导出
+            time.sleep(self.delay)
+            with self._cond:
+                pending, self._pending = self._pending, None
+            try:
+                self.export(None if pending == "all" else pending)
+            except Exception:
+                logger.exception("Static snapshot export failed")
+
+    def export(self, tags=None):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, LOCK_FILE), "ab") as lock:
+                # 每个 worker 都会在后台保存后导出；不加锁时两个进程各自读旧清单、
+                # 各写各的，后写的清单会丢掉另一个进程新加或删除的页面
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                return self._export(tags)
+
+    def _export(self, tags):
+        done = self._read_manifest()  # url -> files written for it
+        client = self.app.test_client()
+        current = set()
+        rendered = 0
+        for path, page_tags in self.pages():
+            for lang in self.languages:
+                url = f"/{lang}{path}"
+                current.add(url)
+                if tags is not None and url in done and not set(page_tags) & tags:
+                    continue
+                files = self._render(client, url)
+                for stale in set(done.get(url, ())) - set(files):
+                    self._remove(stale)
+                if files:
+                    done[url] = files
+                else:
+                    done.pop(url, None)
+                rendered += 1
+        for url in set(done) - current:
+            for stale in done.pop(url):
+                self._remove(stale)
+        self._copy_static()
+        root = ROOT_PAGE.format(
+            default=self.languages[0], languages=json.dumps(list(self.languages))
+        )
+        atomic_write(os.path.join(self.directory, "index.html"), root.encode("utf-8"))
+        atomic_write(
+            os.path.join(self.directory, MANIFEST),
+            json.dumps(done, indent=1).encode("utf-8"),
+        )
+        return rendered
+
+    def _render(self, client, url):
+        """Write ``url`` and the pages chained from it; returns their files."""
+        bodies = []
+        queue, seen = [url], {url}
+        while queue:
+            page = queue.pop(0)
+            response = client.get(page)
+            if response.status_code != 200:
+                if page == url:
+                    return []
+                continue
+            body = response.get_data(as_text=True)
+            if response.is_json:
+                links = [response.get_json().get("next_url")]
+            else:
+                links = [html.unescape(link) for link in NEXT_LINK.findall(body)]
+            for link in links:
+                if link and link not in seen:
+                    seen.add(link)
+                    queue.append(link)
+            bodies.append((page, body))
+
+        files = []
+        for page, body in bodies:
+            for link in seen:
+                target = static_path(link)[1]
+                body = body.replace(f'"{link}"', f'"{target}"')
+                body = body.replace(f'"{html.escape(link)}"', f'"{target}"')
+            name = static_path(page)[0]
+            path = os.path.join(self.directory, *name.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, body.encode("utf-8"))
+            files.append(name)
+        return files
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self.directory, *name.split("/")))
+        except FileNotFoundError:
+            pass
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST), "rb") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _copy_static(self):
+        # 只复制有变化的文件（大小或修改时间不同）
+        source = self.app.static_folder
+        for root, _, files in os.walk(source):
+            target_root = os.path.join(
+                self.directory, "static", os.path.relpath(root, source)
+            )
+            os.makedirs(target_root, exist_ok=True)
+            for name in files:
+                src, dst = os.path.join(root, name), os.path.join(target_root, name)
+                st = os.stat(src)
+                try:
+                    dt = os.stat(dst)
+                    if dt.st_size == st.st_size and dt.st_mtime == st.st_mtime:
+                        continue
+                except FileNotFoundError:
+                    pass
+                shutil.copy2(src, dst)
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 测试不连真实数据库和 Vercel Blob：.env 里的值不会覆盖这里设置的环境变量
+os.environ["POSTGRES_URL_NON_POOLING"] = "host=/nonexistent dbname=peacepet_test"
+os.environ["POSTGRES_REPLICA_URLS"] = ""
+os.environ["BLOB_LOCAL_DIR"] = tempfile.mkdtemp(prefix="peacepet-test-blobs-")
+os.environ.pop("STATIC_EXPORT_DIR", None)
@@ -0,0 +1,498 @@
+import io
+import zipfile
+from types import SimpleNamespace
+
+import psycopg2
+import pytest
+from flask import g, request
+
+import app as storefront
+import catalog_io
+from cache import PageCache
+
+
+def switch_lang_url(path):
+    with storefront.app.test_request_context(path):
+        storefront.pull_lang(request.endpoint, request.view_args)
+        return storefront.switch_lang_url()
+
+
+def test_switch_lang_keeps_query():
+    assert switch_lang_url("/en/deals?after=40") == "/zh/deals?after=40"
+    assert switch_lang_url("/zh/search?q=a&q=b") == "/en/search?q=a&q=b"
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("/en/deals?lang=zh", "/zh/deals"),
+        ("/en/about?endpoint=x", "/zh/about"),
+        ("/en/catalog/dogs?slug=cats", "/zh/catalog/dogs"),
+        ("/en/product/5?product_id=9", "/zh/product/5"),
+        ("/en/deals?_external=1&_anchor=x&_method=GET&_scheme=ftp", "/zh/deals"),
+    ],
+)
+def test_switch_lang_ignores_reserved_query_keys(path, expected):
+    assert switch_lang_url(path) == expected
+
+
+def test_switch_lang_outside_language_pages():
+    with storefront.app.test_request_context("/login"):
+        storefront.g.lang = "en"
+        assert storefront.switch_lang_url() == "/zh/"
+
+
+def test_legacy_redirect_is_negotiated():
+    client = storefront.app.test_client()
+    response = client.get("/deals?after=4", headers={"Accept-Language": "zh"})
+    assert response.status_code == 302
+    assert response.location == "/zh/deals?after=4"
+    assert "Accept-Language" in response.vary
+
+
+class VersionRow:
+    """A connection whose settings row holds ``value``, for read_version()."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params):
+        pass
+
+    def fetchone(self):
+        return {"value": self.value}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Public pages without a database: fixed nav data, fresh caches."""
+    db = VersionRow("1 100")
+    monkeypatch.setattr(storefront, "get_db_conn", lambda: db)
+    for cache in (storefront.nav_cache, storefront.replica_nav_cache):
+        monkeypatch.setattr(cache, "get", lambda get_conn: ((1, 100), ([], {})))
+    for name in ("page_cache", "fragment_cache"):
+        cache = PageCache(storefront.CATALOG_GENERATION_KEY, check_interval=3600)
+        cache.sync(lambda: db)
+        monkeypatch.setattr(storefront, name, cache)
+    return db
+
+
+def test_public_page_is_shared_cacheable(db):
+    client = storefront.app.test_client()
+    response = client.get("/en/about")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == 'W/"1-1-en"'
+    assert response.last_modified.timestamp() == 100
+    assert response.cache_control.public
+    assert response.cache_control.max_age == storefront.PAGE_MAX_AGE
+    assert "Set-Cookie" not in response.headers
+    assert "Cookie" not in response.vary
+
+    response = client.get("/en/about", headers={"If-None-Match": 'W/"1-1-en"'})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == 'W/"1-1-en"'
+    assert "Set-Cookie" not in response.headers
+
+    # 后台改了数据：旧 ETag 不再匹配
+    db.value = "2 101"
+    storefront.page_cache.invalidate((2, 101))
+    response = client.get("/en/about", headers={"If-None-Match": 'W/"1-1-en"'})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == 'W/"1-2-en"'
+
+
+def test_language_root_is_negotiated():
+    client = storefront.app.test_client()
+    response = client.get("/", headers={"Accept-Language": "zh-CN,zh;q=0.9"})
+    assert response.status_code == 302
+    assert response.location == "/zh/"
+    assert "Accept-Language" in response.vary
+    assert "Set-Cookie" not in response.headers
+
+
+def test_page_rendered_during_a_write_is_not_cached(db, monkeypatch):
+    def render_during_write(template, **context):
+        # 页面按旧数据渲染到一半时，后台提交了修改
+        db.value = "2 101"
+        storefront.page_cache.invalidate((2, 101), "products")
+        return "old"
+
+    monkeypatch.setattr(storefront, "render_template", render_during_write)
+    client = storefront.app.test_client()
+    assert client.get("/en/about").data == b"old"
+    assert storefront.page_cache.stats()["size"] == 0
+
+    monkeypatch.setattr(storefront, "render_template", lambda *a, **k: "new")
+    assert client.get("/en/about").data == b"new"
+    assert client.get("/en/about").data == b"new"
+    assert storefront.page_cache.stats()["size"] == 1
+
+
+def test_fragment_built_during_a_write_is_not_cached(db):
+    def build_during_write():
+        db.value = "2 101"
+        storefront.fragment_cache.invalidate((2, 101), "product:7")
+        return "old card"
+
+    with storefront.app.test_request_context("/en/deals"):
+        key = ("card", "en", 7)
+        assert storefront.cached_fragment(key, 7, build_during_write) == "old card"
+        assert storefront.cached_fragment(key, 7, lambda: "new card") == "new card"
+        assert storefront.cached_fragment(key, 7, lambda: "newer") == "new card"
+
+
+@pytest.fixture
+def admin_client(monkeypatch):
+    # 导航数据不查数据库
+    monkeypatch.setattr(
+        storefront.nav_cache, "get", lambda get_conn: ((1, 0), ([], {}))
+    )
+    client = storefront.app.test_client()
+    with client.session_transaction() as session:
+        session["is_admin"] = True
+    return client
+
+
+def test_import_has_its_own_upload_limit(admin_client, monkeypatch):
+    monkeypatch.setitem(storefront.app.config, "MAX_CONTENT_LENGTH", 1024)
+    monkeypatch.setitem(storefront.app.config, "IMPORT_MAX_CONTENT_LENGTH", 4096)
+    images = (io.BytesIO(b"x" * 2048), "images.zip")
+    response = admin_client.post("/admin/edit_category/1", data={"image": images})
+    assert response.status_code == 413
+
+    images = (io.BytesIO(b"x" * 2048), "images.zip")
+    response = admin_client.post("/admin/import/products", data={"images": images})
+    # 没有 file 字段：请求体被读取并解析后才返回 400，而不是 413
+    assert response.status_code == 400
+
+    images = (io.BytesIO(b"x" * 8192), "images.zip")
+    response = admin_client.post("/admin/import/products", data={"images": images})
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize("path", ["/metrics", "/stats/db"])
+def test_public_monitoring_needs_admin_or_token(monkeypatch, path):
+    monkeypatch.setitem(storefront.app.config, "METRICS_TOKEN", "s3cret")
+    client = storefront.app.test_client()
+    assert client.get(path).status_code == 401
+    wrong = {"Authorization": "Bearer nope"}
+    assert client.get(path, headers=wrong).status_code == 401
+    right = {"Authorization": "Bearer s3cret"}
+    assert client.get(path, headers=right).status_code == 200
+
+    monkeypatch.setitem(storefront.app.config, "METRICS_TOKEN", "")
+    assert client.get(path, headers={"Authorization": "Bearer "}).status_code == 401
+    with client.session_transaction() as session:
+        session["is_admin"] = True
+    assert client.get(path).status_code == 200
+
+
+def test_worker_metrics_only_on_internal_app(monkeypatch):
+    monkeypatch.setitem(storefront.app.config, "PUBLIC_METRICS", False)
+    assert storefront.app.test_client().get("/metrics").status_code == 404
+    response = storefront.internal_app.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert b"http_request_duration_seconds" in response.data
+
+
+@pytest.mark.parametrize(
+    "from_replica, expected", [(False, "primary"), (True, "replica")]
+)
+def test_nav_cache_per_database(monkeypatch, from_replica, expected):
+    monkeypatch.setattr(
+        storefront.nav_cache, "get", lambda get_conn: ((2, 0), ([], {"v": "primary"}))
+    )
+    monkeypatch.setattr(
+        storefront.replica_nav_cache,
+        "get",
+        lambda get_conn: ((1, 0), ([], {"v": "replica"})),
+    )
+    monkeypatch.setattr(storefront, "reads_from_replica", lambda: from_replica)
+    with storefront.app.test_request_context("/en/about"):
+        storefront.pull_lang(request.endpoint, request.view_args)
+        storefront.set_language_and_nav()
+        assert storefront.g.settings == {"v": expected}
+
+
+class FakeConn:
+    def __init__(self, queries_before_break=None):
+        self.queries_before_break = queries_before_break
+        self.closed = 0
+
+    def read_version(self):
+        if self.queries_before_break == 0:
+            self.closed = 2
+            raise psycopg2.OperationalError("server closed the connection")
+        if self.queries_before_break is not None:
+            self.queries_before_break -= 1
+        return (1, 0)
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+        self.returned = []
+
+    def getconn(self):
+        return self.conn
+
+    def putconn(self, conn, discard=False):
+        self.returned.append((conn, discard))
+
+
+def test_replica_failure_retries_on_primary(monkeypatch):
+    # 导航数据从副本读到后，视图里的查询时连接断开
+    replica = FakePool(FakeConn(queries_before_break=1))
+    primary = FakePool(FakeConn())
+    marked_down = []
+    monkeypatch.setattr(storefront, "db_pool", primary)
+    monkeypatch.setattr(
+        storefront,
+        "replicas",
+        SimpleNamespace(
+            __bool__=lambda: True,
+            getconn=lambda: (replica, replica.conn),
+            mark_down=marked_down.append,
+        ),
+    )
+    monkeypatch.setattr(
+        storefront, "reads_from_replica", lambda: not g.get("primary_only")
+    )
+    for cache in (storefront.nav_cache, storefront.replica_nav_cache):
+        monkeypatch.setattr(
+            cache, "get", lambda get_conn: (get_conn().read_version(), ([], {}))
+        )
+    monkeypatch.setattr(
+        storefront,
+        "page_cache",
+        SimpleNamespace(
+            sync=lambda get_conn: get_conn().read_version(),
+            version=(1, 0),
+            get=lambda key: None,
+            set=lambda key, value, tags, version: None,
+        ),
+    )
+
+    response = storefront.app.test_client().get("/en/about")
+    assert response.status_code == 200
+    assert marked_down == [replica]
+    assert replica.returned == [(replica.conn, True)]
+    assert primary.returned == [(primary.conn, False)]
+
+
+def test_first_cards_load_eagerly(monkeypatch):
+    keys = []
+
+    def build(key, product_id, render):
+        keys.append(key)
+        return render()
+
+    monkeypatch.setattr(storefront, "cached_fragment", build)
+    product = storefront.ProductCard(1, "Bed", "9.90", "/bed.webp", "")
+    with storefront.app.test_request_context("/en/deals"):
+        storefront.g.lang = "en"
+        cards = [
+            storefront.product_card(product, position=position)
+            for position in (0, 1, storefront.EAGER_CARDS, None)
+        ]
+    assert 'loading="eager" fetchpriority="high"' in cards[0]
+    assert 'loading="eager"' in cards[1] and "fetchpriority" not in cards[1]
+    assert 'loading="lazy"' in cards[2] and cards[2] == cards[3]
+    # 同一商品的三种加载方式分别缓存
+    assert len(set(keys)) == 3
+
+
+class NoProducts:
+    """A cursor over an empty products table that records what it runs."""
+
+    def __init__(self):
+        self.sql = []
+
+    def execute(self, sql, params=None):
+        self.sql.append(sql)
+
+    def fetchall(self):
+        return []
+
+
+def test_import_rejects_unknown_id_without_required_columns():
+    c = NoProducts()
+    with pytest.raises(catalog_io.RowError, match="line 3: title_en is required"):
+        storefront.upsert_product_batch(c, [(3, {"id": 99999, "price": 3.0})])
+    assert not any(sql.startswith("INSERT") for sql in c.sql)
+
+
+def test_import_closes_zip_members(monkeypatch):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as archive:
+        archive.writestr("dog.png", b"png")
+    opened = []
+    archive = zipfile.ZipFile(buf)
+    open_member = archive.open
+    monkeypatch.setattr(
+        archive, "open", lambda name: opened.append(open_member(name)) or opened[-1]
+    )
+    batch = [(2, {"title_en": "Dog bed", "main_image": "dog.png"})]
+    storefront.upload_import_images(batch, archive, {})
+    assert batch[0][1]["main_image"].endswith(".png")
+    assert [f.closed for f in opened] == [True]
+
+
+def test_import_moves_sequence_past_explicit_ids_first(monkeypatch):
+    c = NoProducts()
+
+    def execute_values(c, sql, rows, fetch=False):
+        c.sql.append(sql)
+        return [(n,) for n in range(len(rows))]
+
+    monkeypatch.setattr(storefront, "execute_values", execute_values)
+    new = {"title_en": "New", "price": 1.0}
+    explicit = {"id": 5000, "title_en": "Explicit", "price": 2.0}
+    storefront.upsert_product_batch(c, [(2, new), (3, explicit)])
+    kinds = [
+        "insert with id" if "(id," in sql else "setval" if "setval" in sql else sql
+        for sql in c.sql[1:]
+    ]
+    assert kinds[:2] == ["insert with id", "setval"]
+    assert c.sql[-1].startswith("INSERT INTO products (title_en, price)")
+
+
+class SettingsTable:
+    """The settings upsert against a dict: only values that differ count."""
+
+    def __init__(self):
+        self.values = {}
+        self.statements = []
+        self.rowcount = -1
+
+    def cursor(self):
+        return self
+
+    def execute_values(self, c, sql, rows, page_size=100):
+        assert "IS DISTINCT FROM EXCLUDED.value" in sql
+        assert page_size >= len(rows)
+        self.statements.append(rows)
+        changed = [(key, value) for key, value in rows if self.values.get(key) != value]
+        self.values.update(changed)
+        self.rowcount = len(changed)
+
+
+def test_settings_saved_in_one_upsert_and_bumped_only_on_change(
+    admin_client, monkeypatch
+):
+    table = SettingsTable()
+    bumps = []
+    monkeypatch.setattr(storefront, "get_db_conn", lambda: table)
+    monkeypatch.setattr(storefront, "execute_values", table.execute_values)
+    monkeypatch.setattr(storefront, "commit_nav_change", bumps.append)
+    form = {
+        "admin_action": "UPDATE_SETTINGS",
+        "hero_banner_type": "url",
+        "hero_banner_url": "https://example.com/hero.jpg",
+        "site_title_en": "Peace Pet",
+        "site_title_zh": "和平宠物",
+    }
+    assert admin_client.post("/admin", data=form).status_code == 302
+    assert len(table.statements) == 1
+    assert table.values["site_title_zh"] == "和平宠物"
+    assert bumps == [table]
+
+    # 没有任何值变化：仍是一条语句，但不换代，页面缓存保持有效
+    admin_client.post("/admin", data=form)
+    assert len(table.statements) == 2
+    assert bumps == [table]
+
+    admin_client.post("/admin", data=dict(form, site_title_en="Peace Pets"))
+    assert len(bumps) == 2
+
+
+class FeedbackTable:
+    """Reviews of one product, answering the keyset page query."""
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def cursor(self, cursor_factory=None):
+        return self
+
+    def execute(self, sql, params):
+        assert sql.endswith("ORDER BY id DESC LIMIT %s")
+        product_id, *after, limit = params
+        newer = [i for i in sorted(self.ids, reverse=True) if not after or i < after[0]]
+        self.rows = [(i, 5, f"review {i}", None, None) for i in newer[:limit]]
+
+    def fetchall(self):
+        return self.rows
+
+
+def test_review_pages_follow_the_last_id(monkeypatch):
+    monkeypatch.setattr(storefront, "get_db_conn", lambda: FeedbackTable(range(1, 8)))
+    monkeypatch.setattr(storefront, "REVIEWS_PAGE_SIZE", 3)
+    pages, after = [], ""
+    while after is not None:
+        with storefront.app.test_request_context(f"/en/product/1?after={after}"):
+            g.lang = "en"
+            reviews, after = storefront.fetch_review_page(1)
+        pages.append([review.id for review in reviews])
+    assert pages == [[7, 6, 5], [4, 3, 2], [1]]
+
+
+def test_product_rating_comes_from_review_totals(monkeypatch):
+    product = {
+        "title_en": "Dog bed",
+        "description_en": "",
+        "bullets_en": [],
+        "a_plus_image_list": [],
+        "a_plus_srcset_list": [],
+        "avg_rating": 1.0,
+        "review_count": 4,
+        "review_rating_sum": 18.0,
+        **{f"review_stars_{n}": int(n in (4, 5)) * 2 for n in range(1, 6)},
+    }
+    conn = SimpleNamespace(
+        cursor=lambda: SimpleNamespace(
+            execute=lambda sql, params: None, fetchone=lambda: product
+        )
+    )
+    rendered = {}
+    monkeypatch.setattr(storefront, "get_db_conn", lambda: conn)
+    monkeypatch.setattr(
+        storefront, "render_fragment", lambda name, **context: rendered.update(context)
+    )
+    with storefront.app.test_request_context("/en/product/1"):
+        g.lang = "en"
+        summary = storefront.load_product_summary(1)
+    assert rendered["rating"] == 4.5
+    assert summary.review_count == 4
+    assert summary.star_counts == [(5, 2), (4, 2), (3, 0), (2, 0), (1, 0)]
+
+
+def test_ready_only_after_warm_up(db, monkeypatch):
+    opened = []
+    monkeypatch.setattr(storefront, "ready", storefront.threading.Event())
+    monkeypatch.setattr(storefront, "WARMUP_PAGES", ("/about",))
+    monkeypatch.setattr(storefront.db_pool, "open", opened.append)
+    monkeypatch.setattr(storefront.replicas, "open", opened.append)
+    client = storefront.app.test_client()
+    assert client.get("/healthz").status_code == 200
+    assert client.get("/readyz").status_code == 503
+
+    storefront.warm_up(4)
+    assert opened == [4, 4]
+    assert client.get("/healthz").status_code == 200
+    assert client.get("/readyz").status_code == 200
+    assert storefront.page_cache.stats()["size"] == len(storefront.LANGUAGES)
+
+
+def test_failed_warm_up_stays_unready(db, monkeypatch):
+    monkeypatch.setattr(storefront, "ready", storefront.threading.Event())
+    monkeypatch.setattr(storefront, "WARMUP_PAGES", ("/no-such-page",))
+    monkeypatch.setattr(storefront.db_pool, "open", lambda connections: None)
+    monkeypatch.setattr(storefront.replicas, "open", lambda connections: None)
+    with pytest.raises(RuntimeError, match="returned 404"):
+        storefront.warm_up()
+    assert storefront.app.test_client().get("/readyz").status_code == 503
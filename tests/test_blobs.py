@@ -0,0 +1,100 @@
+import io
+
+import pytest
+
+import blobs
+from blobs import BlobIO, LocalBlobStore, VercelBlobStore
+
+BASE_URL = "http://localhost/blobs"
+
+
+@pytest.fixture
+def blob_io(tmp_path):
+    return BlobIO(LocalBlobStore(str(tmp_path), BASE_URL), retry_delay=0.01)
+
+
+def stored(tmp_path, url):
+    return (tmp_path / url[len(BASE_URL) + 1 :]).read_bytes()
+
+
+def test_put_many_keeps_order_and_never_overwrites(tmp_path, blob_io):
+    urls = blob_io.put_many(
+        [(f"uploads/main_{n}.png", io.BytesIO(b"image %d" % n)) for n in range(5)]
+        + [("uploads/main_0.png", io.BytesIO(b"again"))]
+    )
+    assert [stored(tmp_path, url) for url in urls] == [
+        b"image 0",
+        b"image 1",
+        b"image 2",
+        b"image 3",
+        b"image 4",
+        b"again",
+    ]
+    assert len(set(urls)) == 6
+
+
+def test_failed_upload_deletes_the_others(tmp_path, blob_io):
+    class Broken(io.BytesIO):
+        def read(self, size=-1):
+            raise OSError("client went away")
+
+    with pytest.raises(OSError):
+        blob_io.put_many(
+            [("uploads/a.png", io.BytesIO(b"a")), ("uploads/b.png", Broken())]
+        )
+    blob_io.join()
+    assert list((tmp_path / "uploads").iterdir()) == []
+
+
+def test_delete_later(tmp_path, blob_io):
+    url = blob_io.put("uploads/a.png", io.BytesIO(b"a"))
+    blob_io.delete_later([url, url, "", "https://elsewhere.example/x.png"])
+    blob_io.join()
+    assert list((tmp_path / "uploads").iterdir()) == []
+
+
+def test_large_upload_streams_in_parts(tmp_path, monkeypatch):
+    # 只允许一次读 PART_SIZE 字节，整个文件不会进内存
+    monkeypatch.setattr(blobs, "PART_SIZE", 4)
+
+    class Chunked(io.BytesIO):
+        def read(self, size=-1):
+            assert 0 < size <= blobs.PART_SIZE
+            return super().read(size)
+
+    data = b"0123456789abcdefghij-"
+    store = LocalBlobStore(str(tmp_path), BASE_URL)
+    url = store.put("uploads/big.bin", Chunked(data))
+    assert stored(tmp_path, url) == data
+    with store.open(url) as f:
+        assert f.read() == data
+
+
+def test_vercel_multipart_upload(tmp_path, monkeypatch):
+    monkeypatch.setattr(blobs, "PART_SIZE", 4)
+    parts = tmp_path / "parts"
+    parts.mkdir()
+    monkeypatch.setattr(blobs.vercel_api, "_get_auth_token", lambda options: "t")
+    monkeypatch.setattr(
+        blobs.vercel_api,
+        "_create_multipart_upload",
+        lambda path, headers, options: {"uploadId": "u", "key": "k"},
+    )
+
+    def upload_part(path, upload_id, key, number, chunk, headers, options):
+        (parts / str(number)).write_bytes(chunk)
+        return {"partNumber": number}
+
+    def complete(path, upload_id, key, done, headers, options):
+        assert done == [{"partNumber": n} for n in range(1, len(done) + 1)]
+        data = b"".join((parts / str(n)).read_bytes() for n in range(1, len(done) + 1))
+        (tmp_path / "out").write_bytes(data)
+        return {"url": f"{BASE_URL}/{path}"}
+
+    monkeypatch.setattr(blobs.vercel_api, "_upload_part", upload_part)
+    monkeypatch.setattr(blobs.vercel_api, "_complete_multipart_upload", complete)
+    data = b"0123456789abcdefghij-"
+    url = VercelBlobStore().put("uploads/big.bin", io.BytesIO(data))
+    assert url == f"{BASE_URL}/uploads/big.bin"
+    assert len(list(parts.iterdir())) == 6
+    assert (tmp_path / "out").read_bytes() == data
@@ -0,0 +1,72 @@
+import queries
+from cache import PageCache
+
+KEY = "catalog_generation"
+
+
+class Settings:
+    """The settings table as seen through a connection, for read_version."""
+
+    def __init__(self):
+        self.values = {}
+        self.reads = 0
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params):
+        assert sql == queries.SETTING_VALUE
+        self.reads += 1
+        self.row = (
+            {"value": self.values[params[0]]} if params[0] in self.values else None
+        )
+
+    def fetchone(self):
+        return self.row
+
+
+def filled_cache(settings):
+    cache = PageCache(KEY, check_interval=60.0)
+    settings.values[KEY] = "1 100"
+    cache.sync(lambda: settings)
+    cache.set("/deals", "deals", ("products",))
+    cache.set("/product/1", "p1", ("products", "product:1"))
+    cache.set("/product/2", "p2", ("products", "product:2"))
+    cache.set("/about", "about", ())
+    return cache
+
+
+def test_invalidate_drops_only_tagged_pages():
+    cache = filled_cache(Settings())
+    cache.invalidate((2, 101), "product:1")
+    assert cache.get("/product/1") is None
+    assert cache.get("/product/2") == "p2"
+    assert cache.get("/deals") == "deals"
+
+    cache.invalidate((3, 102), "products")
+    assert [cache.get(key) for key in ("/deals", "/product/2")] == [None, None]
+    assert cache.get("/about") == "about"
+    assert cache.stats()["size"] == 1
+
+
+def test_skipped_generation_clears_everything():
+    # 计数器跳过了一代：期间别的进程也写过，本地标签无法覆盖它的修改
+    cache = filled_cache(Settings())
+    cache.invalidate((3, 102), "product:1")
+    assert cache.stats()["size"] == 0
+
+
+def test_write_by_another_process_clears_on_next_check():
+    settings = Settings()
+    cache = filled_cache(settings)
+    settings.values[KEY] = "2 101"
+    cache.sync(lambda: settings)
+    # check_interval 内不再读计数器
+    assert settings.reads == 1
+    assert cache.get("/about") == "about"
+
+    cache.check_interval = 0.0
+    cache.sync(lambda: settings)
+    assert settings.reads == 2
+    assert cache.version == (2, 101)
+    assert cache.stats()["size"] == 0
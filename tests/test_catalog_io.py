@@ -0,0 +1,43 @@
+import io
+
+import pytest
+
+import catalog_io
+
+
+def test_empty_numeric_cells_are_left_out():
+    product = catalog_io.clean_product(
+        2,
+        {
+            "id": "",
+            "title_en": "Leash",
+            "price": "9.90",
+            "monthly_sales": "",
+            "avg_rating": " ",
+            "is_deal": "yes",
+        },
+    )
+    assert product == {"title_en": "Leash", "price": "9.90", "is_deal": 1}
+
+
+def test_update_converts_present_columns():
+    product = catalog_io.clean_product(
+        3, {"id": "7", "monthly_sales": "12", "avg_rating": "4.5"}
+    )
+    assert product == {"id": 7, "monthly_sales": 12, "avg_rating": 4.5}
+
+
+def test_update_with_only_empty_cells_is_rejected():
+    with pytest.raises(catalog_io.RowError, match="line 4"):
+        catalog_io.clean_product(4, {"id": "7", "monthly_sales": ""})
+
+
+def test_invalid_number_is_rejected():
+    with pytest.raises(catalog_io.RowError, match="monthly_sales"):
+        catalog_io.clean_product(5, {"id": "7", "monthly_sales": "many"})
+
+
+def test_read_records_csv():
+    data = "title_en,price\nLeash,9.90\n".encode("utf-8-sig")
+    records = list(catalog_io.read_records(io.BytesIO(data), "products.csv"))
+    assert records == [(2, {"title_en": "Leash", "price": "9.90"})]
@@ -0,0 +1,86 @@
+import threading
+
+import psycopg2.extensions
+import pytest
+
+from db import ConnectionPool, PoolTimeout
+
+
+class FakeConn:
+    def __init__(self):
+        self.closed = 0
+
+    def get_transaction_status(self):
+        return psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(ConnectionPool, "_connect", lambda self: FakeConn())
+    return ConnectionPool("fake", minconn=1, maxconn=2, timeout=0.05)
+
+
+def test_checkout_times_out_when_pool_is_exhausted(pool):
+    first, second = pool.getconn(), pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    stats = pool.stats()
+    assert (stats["size"], stats["in_use"]) == (2, 2)
+    assert (stats["waits"], stats["timeouts"]) == (1, 1)
+    assert stats["wait_time_seconds"] >= 0.05
+
+    pool.putconn(first)
+    assert pool.getconn() is first
+    assert pool.stats()["checkouts"] == 3
+
+
+def test_waiter_gets_returned_connection(pool):
+    pool.timeout = 5.0
+    held = [pool.getconn(), pool.getconn()]
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+    waiter.start()
+    pool.putconn(held[0])
+    waiter.join(5.0)
+    assert got == [held[0]]
+    assert pool.stats()["timeouts"] == 0
+
+
+def test_discarded_connections_free_their_slot(pool):
+    conn = pool.getconn()
+    pool.putconn(conn, discard=True)
+    assert conn.closed
+    broken = pool.getconn()
+    broken.closed = 2  # 服务器断开了连接
+    pool.putconn(broken)
+    stats = pool.stats()
+    assert (stats["size"], stats["in_use"], stats["idle"]) == (0, 0, 0)
+    assert stats["discarded"] == 2
+
+    # 两个名额都已释放
+    pool.getconn(), pool.getconn()
+    assert pool.stats()["size"] == 2
+
+
+def test_dead_idle_connection_is_replaced_on_checkout(pool):
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.closed = 2
+    fresh = pool.getconn()
+    assert fresh is not conn
+    stats = pool.stats()
+    assert (stats["size"], stats["in_use"], stats["discarded"]) == (1, 1, 1)
+
+
+def test_failed_connect_frees_its_slot(pool, monkeypatch):
+    def refuse(self):
+        raise psycopg2.OperationalError("connection refused")
+
+    monkeypatch.setattr(ConnectionPool, "_connect", refuse)
+    with pytest.raises(psycopg2.OperationalError):
+        pool.getconn()
+    stats = pool.stats()
+    assert (stats["size"], stats["in_use"]) == (0, 0)
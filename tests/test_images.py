@@ -0,0 +1,56 @@
+import io
+
+import pytest
+from PIL import Image
+
+from blobs import LocalBlobStore
+from images import ImagePipeline
+
+BASE_URL = "http://localhost/blobs"
+
+
+def upload(store, image, name):
+    buf = io.BytesIO()
+    image.save(buf, "PNG")
+    buf.seek(0)
+    return store.put(f"uploads/{name}.png", buf)
+
+
+def variant(store, srcset):
+    with store.open(srcset.split(", ")[0].split()[0]) as f:
+        image = Image.open(f)
+        image.load()
+    return image
+
+
+def transparent_palette():
+    image = Image.new("P", (800, 400), 0)
+    image.putpalette([255, 255, 255, 200, 30, 30] + [0] * 762)
+    image.paste(1, (200, 100, 600, 300))
+    image.info["transparency"] = 0
+    return image
+
+
+@pytest.mark.parametrize(
+    "image",
+    [
+        transparent_palette(),
+        Image.new("LA", (800, 400), (128, 0)),
+        Image.new("RGBA", (800, 400), (200, 30, 30, 0)),
+    ],
+    ids=["P+transparency", "LA", "RGBA"],
+)
+def test_transparency_survives_resizing(tmp_path, image):
+    store = LocalBlobStore(str(tmp_path), BASE_URL)
+    srcset = ImagePipeline(store, widths=(320,)).srcset(upload(store, image, "logo"))
+    resized = variant(store, srcset)
+    assert resized.mode == "RGBA"
+    assert resized.width == 320
+    assert resized.getpixel((0, 0))[3] == 0
+
+
+def test_opaque_images_stay_rgb(tmp_path):
+    store = LocalBlobStore(str(tmp_path), BASE_URL)
+    image = Image.new("P", (800, 400), 0)
+    srcset = ImagePipeline(store, widths=(320,)).srcset(upload(store, image, "photo"))
+    assert variant(store, srcset).mode == "RGB"
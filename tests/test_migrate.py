@@ -0,0 +1,17 @@
+import migrate
+import queries
+
+
+def test_hot_queries_have_a_parameter_per_placeholder():
+    for name, sql, params in migrate.HOT_QUERIES:
+        assert sql.count("%s") == len(params), name
+
+
+def test_hot_queries_cover_admin_sorts():
+    # 迁移 0007 为后台表格除 id 外的每种排序建了索引
+    sql = "\n".join(sql for _, sql, _ in migrate.HOT_QUERIES)
+    for sorts in (queries.ADMIN_ORDER_SORTS, queries.ADMIN_PRODUCT_SORTS):
+        for key, column in sorts.items():
+            if key == "id":
+                continue
+            assert f"ORDER BY {column} DESC" in sql
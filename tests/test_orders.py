@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+
+import run
+from orders import OrderJournal
+
+
+def write_segment(path, records, torn=None):
+    with open(path, "wb") as f:
+        for record in records:
+            f.write((json.dumps(record) + "\n").encode("utf-8"))
+        if torn is not None:
+            f.write(torn.encode("utf-8"))
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class Orders:
+    """write_batch for tests: stores orders by intake_id, like the upsert."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.rows = {}
+        self.batches = 0
+        self.lock = threading.Lock()
+
+    def write_batch(self, records):
+        with self.lock:
+            self.batches += 1
+            if self.failures:
+                self.failures -= 1
+                raise OSError("database unavailable")
+            for record in records:
+                self.rows[record["intake_id"]] = record
+
+
+def test_replay_writes_and_removes_abandoned_segments(tmp_path):
+    old = tmp_path / "worker-3"
+    old.mkdir()
+    write_segment(old / "000000000001.jsonl", [{"intake_id": "a"}])
+    write_segment(old / "000000000002.jsonl", [{"intake_id": "b"}])
+    batches = []
+    journal = OrderJournal(str(tmp_path / "journal"), batches.append)
+    journal.replay(str(old))
+    assert batches == [[{"intake_id": "a"}], [{"intake_id": "b"}]]
+    assert list(old.iterdir()) == []
+
+
+def test_replay_drops_torn_last_line(tmp_path):
+    old = tmp_path / "worker-1"
+    old.mkdir()
+    write_segment(
+        old / "000000000001.jsonl",
+        [{"intake_id": "a"}, {"intake_id": "b"}],
+        torn='{"intake_id": "c", "prod',
+    )
+    orders = Orders()
+    OrderJournal(str(tmp_path / "journal"), orders.write_batch).replay(str(old))
+    assert sorted(orders.rows) == ["a", "b"]
+    assert list(old.iterdir()) == []
+
+
+def test_segment_written_again_after_crash_is_idempotent(tmp_path):
+    # 上次写入数据库后、删除分段前进程退出：重启时同一批记录会再写一次
+    directory = tmp_path / "journal"
+    directory.mkdir()
+    write_segment(
+        directory / "000000000001.jsonl", [{"intake_id": "a"}, {"intake_id": "b"}]
+    )
+    orders = Orders()
+    orders.write_batch([{"intake_id": "a"}, {"intake_id": "b"}])
+    journal = OrderJournal(str(directory), orders.write_batch, flush_interval=0.01)
+    journal.start()
+    journal.append({"intake_id": "c"})
+    wait_for(lambda: len(orders.rows) == 3 and orders.batches == 3)
+    assert sorted(orders.rows) == ["a", "b", "c"]
+
+
+def test_failed_batch_keeps_segment_until_written(tmp_path):
+    directory = tmp_path / "journal"
+    orders = Orders(failures=1)
+    journal = OrderJournal(
+        str(directory), orders.write_batch, flush_interval=0.01, retry_delay=0.2
+    )
+    journal.append({"intake_id": "a"})
+    wait_for(lambda: orders.batches == 1)
+    # 写入失败后记录仍在日志分段里，等待重试
+    segments = sorted(directory.iterdir())
+    assert b'"intake_id": "a"' in segments[0].read_bytes()
+    assert orders.rows == {}
+    wait_for(lambda: orders.rows)
+    assert list(orders.rows) == ["a"]
+    wait_for(lambda: len(list(directory.iterdir())) == 1)
+
+
+def test_orphaned_journals_of_removed_workers_are_replayed(tmp_path, monkeypatch):
+    # 从 4 个 worker 调回 2 个：worker-2、worker-3 的日志没有进程接手
+    for slot in (1, 2, 3):
+        (tmp_path / f"worker-{slot}").mkdir()
+        write_segment(
+            tmp_path / f"worker-{slot}" / "000000000001.jsonl",
+            [{"intake_id": f"w{slot}"}],
+        )
+    monkeypatch.setattr(run, "ORDER_JOURNAL_DIR", str(tmp_path))
+    monkeypatch.setattr(run, "WORKERS", 2)
+    orders = Orders()
+    run.replay_orphaned_journals(OrderJournal(str(tmp_path), orders.write_batch))
+    assert sorted(orders.rows) == ["w2", "w3"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["worker-1"]
@@ -0,0 +1,111 @@
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# master 进程：每个 worker 启动时在 log 里记一行 "slot pid"，响应体是自己的 pid
+MASTER = """
+import os, sys
+from prefork import PreforkServer
+
+port, workers, max_requests, log = sys.argv[1:]
+
+def load_app(slot):
+    with open(log, "a") as f:
+        f.write(f"{slot} {os.getpid()}\\n")
+
+    def app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [str(os.getpid()).encode()]
+
+    return app
+
+PreforkServer(
+    load_app, "127.0.0.1", int(port), int(workers),
+    threads=2, max_requests=int(max_requests), graceful_timeout=5,
+).run()
+"""
+
+
+def wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Master:
+    def __init__(self, tmp_path, workers, max_requests=0):
+        self.port = free_port()
+        self.log = tmp_path / "workers.log"
+        self.log.touch()
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", MASTER, str(self.port), str(workers)]
+            + [str(max_requests), str(self.log)],
+            cwd=ROOT,
+        )
+
+    def started(self):
+        """``(slot, pid)`` of every worker started so far, in order."""
+        return [
+            tuple(map(int, line.split()))
+            for line in self.log.read_text().split("\n")
+            if line
+        ]
+
+    def get(self):
+        url = f"http://127.0.0.1:{self.port}/"
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return int(response.read())
+
+    def stop(self):
+        self.process.send_signal(signal.SIGTERM)
+        return self.process.wait(timeout=30)
+
+
+def alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_worker_recycled_after_max_requests(tmp_path):
+    master = Master(tmp_path, workers=1, max_requests=3)
+    try:
+        wait_for(lambda: master.started())
+        pids = [master.get() for _ in range(6)]
+    finally:
+        assert master.stop() == 0
+    first, second = [pid for _, pid in master.started()][:2]
+    assert pids == [first] * 3 + [second] * 3
+    assert not alive(first) and not alive(second)
+
+
+def test_hup_replaces_workers_one_slot_at_a_time(tmp_path):
+    master = Master(tmp_path, workers=2)
+    try:
+        wait_for(lambda: len(master.started()) == 2)
+        old = [pid for _, pid in master.started()]
+        assert master.get() in old
+        master.process.send_signal(signal.SIGHUP)
+        wait_for(lambda: len(master.started()) == 4)
+        assert [slot for slot, _ in master.started()[2:]] == [0, 1]
+        wait_for(lambda: not any(alive(pid) for pid in old))
+        new = [pid for _, pid in master.started()[2:]]
+        assert master.get() in new
+    finally:
+        assert master.stop() == 0
+    assert not any(alive(pid) for pid in new)
@@ -0,0 +1,71 @@
+import json
+import threading
+
+import pytest
+from flask import Flask
+
+from snapshot import LOCK_FILE, MANIFEST, StaticSnapshot, fcntl, static_path
+
+site = Flask(__name__)
+
+
+@site.route("/en/<name>")
+@site.route("/en/catalog/<name>")
+def page(name):
+    return f"<p>{name}</p>"
+
+
+def manifest(directory):
+    return json.loads((directory / MANIFEST).read_text())
+
+
+def test_export_writes_pages_and_manifest(tmp_path):
+    snapshot = StaticSnapshot(
+        site, str(tmp_path), lambda: [("/a", ()), ("/b", ())], languages=("en",)
+    )
+    assert snapshot.export() == 2
+    assert (tmp_path / "en" / "a" / "index.html").read_text() == "<p>a</p>"
+    assert manifest(tmp_path) == {
+        "/en/a": ["en/a/index.html"],
+        "/en/b": ["en/b/index.html"],
+    }
+
+
+@pytest.mark.skipif(fcntl is None, reason="needs fcntl")
+def test_export_waits_for_another_process(tmp_path):
+    snapshot = StaticSnapshot(
+        site, str(tmp_path), lambda: [("/a", ())], languages=("en",)
+    )
+    # 另一个 worker 正在导出：它持有锁文件上的 flock
+    with open(tmp_path / LOCK_FILE, "ab") as held:
+        fcntl.flock(held, fcntl.LOCK_EX)
+        export = threading.Thread(target=snapshot.export)
+        export.start()
+        export.join(0.3)
+        assert export.is_alive()
+        assert not (tmp_path / MANIFEST).exists()
+    export.join(5.0)
+    assert manifest(tmp_path) == {"/en/a": ["en/a/index.html"]}
+
+
+def test_static_path_decodes_file_names():
+    assert static_path("/zh/catalog/%E7%8C%AB") == (
+        "zh/catalog/猫/index.html",
+        "/zh/catalog/%E7%8C%AB/",
+    )
+    assert static_path("/en/deals?after=40&format=json") == (
+        "en/deals/after-40.json",
+        "/en/deals/after-40.json",
+    )
+
+
+def test_export_writes_root_page_and_decoded_directories(tmp_path):
+    snapshot = StaticSnapshot(
+        site, str(tmp_path), lambda: [("/catalog/%E7%8C%AB", ())], languages=("en",)
+    )
+    snapshot.export()
+    assert (tmp_path / "en" / "catalog" / "猫" / "index.html").read_text(
+        encoding="utf-8"
+    ) == "<p>猫</p>"
+    root = (tmp_path / "index.html").read_text()
+    assert 'url=/en/"' in root and 'languages = ["en"]' in root